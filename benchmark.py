@@ -0,0 +1,532 @@
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+
+from git import Reference, RemoteReference
+
+from utils import commitgraph
+from utils.cache import DivergenceCache
+from utils.git import Branch, BranchRecord, File, Repository, Stage
+from utils.headless import headlessCurses
+from utils.replay import parseScript, replayBranches, replayStage, summarize
+from utils.synthetic import SyntheticSpec, generate
+
+SPEC_FILENAME = 'synthetic.json'
+VIEWPORT_ROWS = 50
+VIEWPORT_WIDTH = 120
+DIVERGENCE_SAMPLE = 50
+DEEP_HISTORY = 100000
+REGRESSION_THRESHOLD = 0.2
+REPLAY_SCRIPTS = {
+    'branches': 'key f; type feat; key ENTER; key DOWN 500; key s; key c',
+    'stage': 'key DOWN 200; key m 20; key u; key UP 200',
+}
+
+
+def legacy_status(stage):
+    repo = stage.repo
+    result = [File.from_diff(diff, True) for diff in repo.index.diff(repo.head.commit)]
+    result += [File.from_diff(diff, False) for diff in repo.index.diff(None)]
+    result += [File.untracked_file(f) for f in repo.untracked_files]
+    result.sort(key=lambda file: file.get_relative_path())
+    return result
+
+class LegacyFile:
+
+    # the layout of File before it got __slots__
+    def __init__(self, relative_path, tracked, staged, renamed, change_type):
+        super().__init__()
+        self.__relative_path = relative_path
+        self.__tracked = tracked
+        self.__staged = staged
+        self.__renamed = renamed
+        self.__change_type = change_type
+
+
+class LegacyBranch:
+
+    # the layout of Branch before it got __slots__, holding GitPython references and a preformatted label
+    def __init__(self, record):
+        super().__init__()
+        self.head = record.head
+        self.remote = record.remote
+        self.reference = Reference(None, record.refname)
+        self.commitsBehind = record.commitsBehind
+        self.commitsAhead = record.commitsAhead
+        self.upstream = RemoteReference(None, record.upstreamRefname) if record.upstreamRefname else None
+
+        self.diff = ''
+        if self.commitsAhead:
+            self.diff += '↑·{}'.format(self.commitsAhead)
+
+        if self.commitsBehind:
+            self.diff += '↓·{}'.format(self.commitsBehind)
+
+def describe(files):
+    return [(f.get_relative_path(), f.is_tracked(), f.is_staged(), f.is_renamed(), f.get_change_type()) for f in files]
+
+def measure(function, runs, setup=None):
+    timings = timeit.repeat(function, setup=setup or (lambda: None), number=1, repeat=runs)
+    return min(timings), statistics.median(timings)
+
+def printTimings(rows):
+    print('{:<28} {:>10} {:>10}'.format('', 'min [ms]', 'median [ms]'))
+    for name, (best, median) in rows:
+        print('{:<28} {:>10.1f} {:>10.1f}'.format(name, best * 1000, median * 1000))
+
+def benchmarkStatus(directory, runs):
+    stage = Stage(directory)
+
+    files = stage.status()
+    identical = describe(files) == describe(legacy_status(stage))
+    print('{} entries, results identical: {}'.format(len(files), 'yes' if identical else 'NO'))
+
+    legacy = measure(lambda: legacy_status(stage), runs)
+    porcelain = measure(stage.status, runs)
+    printTimings([
+        ('three calls (legacy)', legacy),
+        ('porcelain v2 (Stage.status)', porcelain),
+    ])
+    print('speedup (median): {:.2f}x'.format(legacy[1] / porcelain[1]))
+
+def prepareSyntheticRepository(directory, spec):
+    specPath = os.path.join(directory, SPEC_FILENAME)
+    try:
+        with open(specPath) as file:
+            if json.load(file) == spec.toDict():
+                return os.path.join(directory, 'repository')
+    except (OSError, ValueError):
+        pass
+
+    if os.listdir(directory):
+        raise SystemExit('error: {} is neither empty nor holds a synthetic repository generated with the same parameters'.format(directory))
+
+    started = time.perf_counter()
+    repository = generate(directory, spec)
+    with open(specPath, 'w') as file:
+        json.dump(spec.toDict(), file)
+
+    print('generated synthetic repository in {:.1f}s'.format(time.perf_counter() - started), file=sys.stderr)
+    return repository
+
+def gitBenchmarks(directory):
+    repository = Repository(directory)
+    cachePath = os.path.join(repository.repo.common_dir, DivergenceCache.FILENAME)
+
+    def coldCache():
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+        repository.divergenceCache = DivergenceCache(cachePath)
+
+    branches = [ branch for branch in repository.getBranches(withDivergence=False) if branch.upstream ][:DIVERGENCE_SAMPLE]
+
+    def countDivergence():
+        for branch in branches:
+            repository.countDivergence(branch.commit, branch.upstreamCommit)
+
+    listed = repository.getBranches()
+    stage = Stage(directory)
+
+    return [
+        ('getBranches (cold cache)', lambda: repository.getBranches(), coldCache),
+        ('getBranches (warm cache)', lambda: repository.getBranches(), None),
+        ('getBranches (remotes)', lambda: repository.getBranches(local=False, remotes=True), None),
+        ('updateBranches (unchanged)', lambda: repository.updateBranches(listed), None),
+        ('iterBranches (first screen)', lambda: list(itertools.islice(repository.iterBranches(), VIEWPORT_ROWS)), None),
+        ('divergence (for-each-ref)', repository.divergence, None),
+        ('countDivergence x{}'.format(len(branches)), countDivergence, coldCache),
+        ('Stage.status', stage.status, None),
+    ]
+
+def renderViewport(delegate, rows):
+    for i, data in enumerate(rows):
+        delegate.build_row(i, data, i == 0, VIEWPORT_WIDTH)
+
+def loadBranches(ui):
+    ui.refreshList()
+    while ui.isLoadingBranches():
+        time.sleep(0.001)
+        ui.collectBranches()
+
+def rowBenchmarks(directory):
+    from branches import UI
+    from stage import TableViewDelegate
+
+    ui = UI(Repository(directory), False)
+    loadBranches(ui)
+    branches = [ ui.get_data(i) for i in range(min(ui.number_of_rows(), VIEWPORT_ROWS)) ]
+
+    delegate = TableViewDelegate({})
+    delegate.files = Stage(directory).status()[:VIEWPORT_ROWS]
+
+    return [
+        ('branches rows (built)', lambda: renderViewport(ui, branches), lambda: loadBranches(ui)),
+        ('branches rows (cached)', lambda: renderViewport(ui, branches), None),
+        ('stage rows (built)', lambda: renderViewport(delegate, delegate.files), delegate.row_cache.clear),
+        ('stage rows (cached)', lambda: renderViewport(delegate, delegate.files), None),
+    ]
+
+def runBenchmarks(benchmarks, runs, results):
+    for name, function, setup in benchmarks:
+        best, median = measure(function, runs, setup)
+        results[name] = { 'min': best * 1000, 'median': median * 1000 }
+
+def compareToBaseline(results, baseline, threshold):
+    regressions = []
+    print('{:<28} {:>10} {:>10} {:>10} {:>8}'.format('', 'min [ms]', 'median [ms]', 'baseline', 'change'))
+    for name, result in results.items():
+        if 'skipped' in result:
+            print('{:<28} skipped: {}'.format(name, result['skipped']))
+            continue
+
+        previous = baseline.get(name, {}).get('median')
+        if not previous:
+            print('{:<28} {:>10.1f} {:>10.1f} {:>10} {:>8}'.format(name, result['min'], result['median'], '-', '-'))
+            continue
+
+        change = result['median'] / previous - 1
+        regressed = change > threshold
+        if regressed:
+            regressions.append(name)
+
+        print('{:<28} {:>10.1f} {:>10.1f} {:>10.1f} {:>+7.0%}{}'.format(
+            name, result['min'], result['median'], previous, change, '  REGRESSION' if regressed else ''))
+
+    return regressions
+
+def benchmarkSuite(directory, spec, runs, output, baselinePath, threshold):
+    repository = prepareSyntheticRepository(directory, spec)
+
+    results = {}
+    runBenchmarks(gitBenchmarks(repository), runs, results)
+
+    with headlessCurses():
+        try:
+            runBenchmarks(rowBenchmarks(repository), runs, results)
+        except ImportError as e:
+            results['row rendering'] = { 'skipped': str(e) }
+
+    gitVersion = subprocess.run(['git', '--version'], stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+    report = {
+        'spec': spec.toDict(),
+        'runs': runs,
+        'git': gitVersion,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+    baseline = {}
+    if baselinePath:
+        with open(baselinePath) as file:
+            previous = json.load(file)
+        if previous.get('spec') != report['spec']:
+            print('warning: the baseline was recorded with different synthetic repository parameters', file=sys.stderr)
+        baseline = previous.get('results', {})
+
+    regressions = compareToBaseline(results, baseline, threshold)
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if regressions:
+        print('{} regression(s) above {:.0%}: {}'.format(len(regressions), threshold, ', '.join(regressions)), file=sys.stderr)
+        exit(1)
+
+def benchmarkReplay(ui, directory, script, height, width, output):
+    keys = parseScript(script)
+    if ui == 'branches':
+        repository = Repository(directory)
+        screen = replayBranches(repository, keys, height, width)
+    else:
+        repository = Stage(directory)
+        screen = replayStage(repository, keys, height, width)
+
+    summary = summarize(screen.samples)
+    print('{:<12} {:>6} {:>9} {:>9} {:>9} {:>9} {:>7} {:>9} {:>5}'.format('', 'keys', 'p50 [ms]', 'p90 [ms]', 'p99 [ms]', 'max [ms]', 'frames', 'cells', 'git'))
+    for label, row in summary.items():
+        print('{:<12} {:>6} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>7} {:>9} {:>5}'.format(
+            label, row['keys'], row['p50'], row['p90'], row['p99'], row['max'], row['frames'], row['cells'], row['git']))
+
+    spawned = repository.spawnedProcesses()
+    print('frames rendered: {}, git processes spawned: {} ({})'.format(
+        screen.frames, sum(spawned.values()), ', '.join('{} {}'.format(command, count) for command, count in spawned.most_common())))
+
+    if output:
+        with open(output, 'w') as file:
+            json.dump({ 'ui': ui, 'script': script, 'size': [height, width], 'keys': summary, 'git': spawned }, file, indent=2)
+
+def footprint(build):
+    gc.collect()
+    tracemalloc.start()
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    # a full collection has to visit every instance that is alive
+    started = time.perf_counter()
+    gc.collect()
+    return len(objects), size, time.perf_counter() - started
+
+def branchRecord(i):
+    # every other branch is a local one tracking its counterpart on origin
+    name = 'feature/TICKET-{}-synthetic'.format(i // 2)
+    if i % 2:
+        return BranchRecord('refs/remotes/origin/' + name, name, 'origin', '{:040x}'.format(i), None, None, None, False)
+
+    return BranchRecord('refs/heads/' + name, name, None, '{:040x}'.format(i), 'refs/remotes/origin/' + name, 'origin/' + name, (i % 7, i % 5), False)
+
+def benchmarkMemory(fileCount, branchCount):
+    # the inputs are shared by both layouts and allocated before measuring, so only the instances are compared
+    paths = [ 'src/module{:03d}/file{:06d}.py'.format(i % 1000, i) for i in range(fileCount) ]
+    records = [ branchRecord(i) for i in range(branchCount) ]
+
+    def compactBranches():
+        branches = [ Branch(None, record) for record in records ]
+        for branch, record in zip(branches, records):
+            branch.setDivergence((record.commitsAhead, record.commitsBehind) if record.upstream else None)
+        return branches
+
+    print('{:<8} {:>9} {:>13} {:>14} {:>7} {:>15} {:>16}'.format('', 'objects', 'legacy [MiB]', 'compact [MiB]', 'saved', 'gc legacy [ms]', 'gc compact [ms]'))
+    for name, legacy, compact in [
+        ('File', lambda: [ LegacyFile(path, True, False, True, 'R') for path in paths ], lambda: [ File(path, True, False, True, 'R') for path in paths ]),
+        ('Branch', lambda: [ LegacyBranch(record) for record in records ], compactBranches),
+    ]:
+        count, legacySize, legacyPause = footprint(legacy)
+        _, compactSize, compactPause = footprint(compact)
+        print('{:<8} {:>9} {:>13.1f} {:>14.1f} {:>7.0%} {:>15.1f} {:>16.1f}'.format(
+            name, count, legacySize / 2 ** 20, compactSize / 2 ** 20, 1 - compactSize / legacySize, legacyPause * 1000, compactPause * 1000))
+
+def removeCommitGraph(repository):
+    single, chain = commitgraph.paths(os.path.join(repository.repo.common_dir, 'objects'))
+    if os.path.exists(single):
+        os.remove(single)
+    shutil.rmtree(os.path.dirname(chain), ignore_errors=True)
+
+def commitGraphBenchmarks(repository, history):
+    git = repository.repo.git
+    cachePath = os.path.join(repository.repo.common_dir, DivergenceCache.FILENAME)
+
+    def coldCache():
+        if os.path.exists(cachePath):
+            os.remove(cachePath)
+        repository.divergenceCache = DivergenceCache(cachePath)
+
+    # the synthetic branches fork off the tip, the stale ones off the middle and the root of the history
+    branches = [ branch for branch in repository.getBranches(withDivergence=False) if branch.upstream ][:DIVERGENCE_SAMPLE]
+    tip = repository.resolve('master')
+    root = git.rev_list('--max-parents=0', 'master').split()[0]
+    middle = repository.resolve('master~{}'.format(history // 2))
+    stale = [ (root, tip), (middle, tip) ]
+
+    def countDivergence(pairs, exact=False):
+        for commit, upstreamCommit in pairs:
+            repository.countDivergence(commit, upstreamCommit, exact)
+
+    branchPairs = [ (branch.commit, branch.upstreamCommit) for branch in branches ]
+    return [
+        ('countDivergence x{}'.format(len(branchPairs)), lambda: countDivergence(branchPairs), coldCache),
+        ('countDivergence (stale)', lambda: countDivergence(stale), coldCache),
+        ('countDivergence (exact)', lambda: countDivergence(stale, True), coldCache),
+        ('isAncestor (root of tip)', lambda: repository.isAncestor(root, tip), None),
+        ('isAncestor (tip of root)', lambda: repository.isAncestor(tip, root), None),
+        ('mergedBranches', lambda: repository.mergedBranches(middle), None),
+    ]
+
+def benchmarkCommitGraph(directory, history, runs):
+    spec = SyntheticSpec(branches=20, history=history, tracked=10, modified=0, untracked=0)
+    repository = Repository(prepareSyntheticRepository(directory, spec))
+
+    removeCommitGraph(repository)
+    without = {}
+    runBenchmarks(commitGraphBenchmarks(repository, history), runs, without)
+
+    started = time.perf_counter()
+    repository.writeCommitGraph()
+    print('commit-graph of {} commits written in {:.1f}s'.format(len(repository.commitGraph()), time.perf_counter() - started))
+
+    graph = {}
+    runBenchmarks(commitGraphBenchmarks(repository, history), runs, graph)
+
+    print('{:<28} {:>16} {:>14} {:>8}'.format('median [ms]', 'no commit-graph', 'commit-graph', 'speedup'))
+    for name, result in without.items():
+        print('{:<28} {:>16.1f} {:>14.1f} {:>7.1f}x'.format(name, result['median'], graph[name]['median'], result['median'] / graph[name]['median']))
+
+def parseArguments():
+    argparser = argparse.ArgumentParser(
+        prog='benchmark',
+        description='Times the git operations the tools rely on against a repository.'
+    )
+    targets = argparser.add_subparsers(dest='TARGET', metavar='TARGET', help='The operation that shall be benchmarked.')
+    targets.required = True
+
+    status = targets.add_parser('status', help='Compares Stage.status against the former three call implementation.')
+    status.add_argument(
+        'PATH', nargs="?",
+        help='The path to the git repository that shall be used. If no path is provided the current working directory will be used.'
+    )
+
+    suite = targets.add_parser('suite', help='Times repository access and row rendering against a generated synthetic repository.')
+    suite.add_argument(
+        '-d',
+        '--directory',
+        help="Where the synthetic repository is generated and reused on later runs with the same parameters. A temporary directory is used if omitted."
+    )
+    suite.add_argument(
+        '-o',
+        '--output',
+        help="Writes the results as JSON to this file, to be used as a baseline later on."
+    )
+    suite.add_argument(
+        '-b',
+        '--baseline',
+        help="A JSON file written by a previous run. Medians that got slower by more than the threshold are reported as regressions."
+    )
+    suite.add_argument(
+        '-t',
+        '--threshold',
+        help="The relative slowdown that counts as a regression.",
+        type=float,
+        default=REGRESSION_THRESHOLD
+    )
+
+    defaults = SyntheticSpec()
+    for name, help in [
+        ('branches', 'Number of local branches, each tracking a branch on one of the remotes.'),
+        ('depth', 'Maximum number of commits a branch is ahead and behind of its upstream.'),
+        ('history', 'Number of commits on master before the branches fork off.'),
+        ('tracked', 'Number of tracked files.'),
+        ('modified', 'Number of tracked files with unstaged modifications.'),
+        ('untracked', 'Number of untracked files.'),
+        ('remotes', 'Number of remotes, each backed by a local bare repository.'),
+        ('seed', 'Seed for the random divergence of the branches.'),
+    ]:
+        suite.add_argument('--' + name, help=help, type=int, default=getattr(defaults, name))
+
+    replay = targets.add_parser('replay', help='Replays a keystroke script against one of the UIs without a terminal and reports per key latencies.')
+    replay.add_argument(
+        'UI',
+        choices=['branches', 'stage'],
+        help='The UI that shall be driven.'
+    )
+    replay.add_argument(
+        'PATH', nargs="?",
+        help='The path to the git repository that shall be used. If no path is provided the current working directory will be used.'
+    )
+    replay.add_argument(
+        '-k',
+        '--keys',
+        help="The keystroke script, e.g. 'key f; type feat; key ENTER; key DOWN 500; key s'. A default script for the UI is used if omitted."
+    )
+    replay.add_argument(
+        '-f',
+        '--file',
+        help="Reads the keystroke script from a file, one command per line."
+    )
+    replay.add_argument(
+        '--height',
+        help="Height of the simulated terminal.",
+        type=int,
+        default=50
+    )
+    replay.add_argument(
+        '--width',
+        help="Width of the simulated terminal.",
+        type=int,
+        default=160
+    )
+    replay.add_argument(
+        '-o',
+        '--output',
+        help="Writes the per key statistics as JSON to this file."
+    )
+
+    memory = targets.add_parser('memory', help='Compares the memory footprint of the File and Branch instances against their former layout.')
+    memory.add_argument(
+        '--files',
+        help="Number of File instances, as listed after a large rename.",
+        type=int,
+        default=200000
+    )
+    memory.add_argument(
+        '--branches',
+        help="Number of Branch instances, half of them remote ones.",
+        type=int,
+        default=60000
+    )
+
+    graph = targets.add_parser('commit-graph', help='Times divergence and reachability queries on a deep synthetic history without and with a commit-graph.')
+    graph.add_argument(
+        '-d',
+        '--directory',
+        help="Where the synthetic repository is generated and reused on later runs with the same parameters. A temporary directory is used if omitted."
+    )
+    graph.add_argument(
+        '--history',
+        help="Number of commits on master before the branches fork off.",
+        type=int,
+        default=DEEP_HISTORY
+    )
+
+    for parser in [status, suite, graph]:
+        parser.add_argument(
+            '-r',
+            '--runs',
+            help="How often each variant is run.",
+            type=int,
+            default=10
+        )
+
+    return argparser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parseArguments()
+
+    if args.TARGET == 'status':
+        directory = os.path.abspath(args.PATH) if args.PATH else os.getcwd()
+        benchmarkStatus(directory, args.runs)
+
+    elif args.TARGET == 'suite':
+        spec = SyntheticSpec(args.branches, args.depth, args.history, args.tracked, args.modified, args.untracked, args.remotes, args.seed)
+        if args.directory:
+            os.makedirs(args.directory, exist_ok=True)
+            benchmarkSuite(os.path.abspath(args.directory), spec, args.runs, args.output, args.baseline, args.threshold)
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                benchmarkSuite(directory, spec, args.runs, args.output, args.baseline, args.threshold)
+
+    elif args.TARGET == 'replay':
+        directory = os.path.abspath(args.PATH) if args.PATH else os.getcwd()
+        script = REPLAY_SCRIPTS[args.UI]
+        if args.file:
+            with open(args.file) as file:
+                script = file.read()
+        elif args.keys:
+            script = args.keys
+
+        benchmarkReplay(args.UI, directory, script, args.height, args.width, args.output)
+
+    elif args.TARGET == 'memory':
+        benchmarkMemory(args.files, args.branches)
+
+    elif args.TARGET == 'commit-graph':
+        if args.directory:
+            os.makedirs(args.directory, exist_ok=True)
+            benchmarkCommitGraph(os.path.abspath(args.directory), args.history, args.runs)
+        else:
+            with tempfile.TemporaryDirectory() as directory:
+                benchmarkCommitGraph(directory, args.history, args.runs)
@@ -5,11 +5,31 @@ import sys
 import subprocess
 import time
 from utils.git import Repository
+from utils.divergence import DivergenceLoader
+from utils.branchloader import BranchLoader
+from utils.filter import BranchFilter
+from utils.rowcache import RowCache
+from utils.damage import DamageTrackingWindow
+from utils.fetch import RemoteFetcher
+from utils.graphwriter import CommitGraphWriter
+from utils.merged import MergedLoader
+from utils.watcher import RepositoryWatcher
+from utils.workspace import WorkspaceLoader, loadBranches, discoverRepositories
+from utils import ndjson, profiler
 from gupy.view import Label, HBox, BackgroundView, ListView, ListViewDelegate, ListViewDataSource, View
 from gupy.geometry import Padding
 from gupy.screen import ConstrainedBasedScreen
 from pathlib import Path
-from git import GitCommandError
+from git import GitCommandError, InvalidGitRepositoryError
+
+def gitErrors(error):
+    # GitPython labels and quotes stderr, only the errors themselves fit into the header
+    text = error.stderr.strip()
+    if text.startswith("stderr: '"):
+        text = text[len("stderr: '"):-1]
+
+    lines = text.splitlines()
+    return ' '.join([ line for line in lines if line.startswith(('error:', 'fatal:')) ] or lines[:1])
 
 def shortenPath(path):
     try:
@@ -39,6 +59,9 @@ class Keys:
     L = ord('l')
     T = ord('t')
     D = ord('d')
+    E = ord('e')
+    G = ord('g')
+    X = ord('x')
 
 class Colorpairs:
     KEY = 1
@@ -55,11 +78,18 @@ class Colorpairs:
     CONFIRMATION_SELECTION = 12
     VIEW = 13
     UPSTREAM = 14
+    MERGED = 15
+
+class Timeouts:
+    FIRST_PAGE = 10
+    LOADING = 100
+    WATCHING = 250
+    IDLE = -1
 
 class Legends:
 
     @staticmethod
-    def main(onlyLocal, hasFilter, upstreamsVisible, sordedDescending):
+    def main(onlyLocal, hasFilter, upstreamsVisible, sordedDescending, divergenceLimited=False, commitGraphWanted=False, markedCount=0, mergedBase=None):
         result = [
             ('[UP]', ' Scroll up '),
             ('[DOWN]', ' Scroll down '),
@@ -72,7 +102,14 @@ class Legends:
         result.append(('[M]', ' Merge '))
 
         if onlyLocal:
-            result.append(('[D]', ' Delete '))
+            if markedCount:
+                result.append(('[D]', ' Delete marked ({}) '.format(markedCount)))
+            else:
+                result.append(('[D]', ' Delete '))
+
+            result.append(('[SPACE]', ' Mark '))
+            if mergedBase:
+                result.append(('[X]', ' Mark merged into {} '.format(mergedBase)))
 
         if onlyLocal:
             result.append(('[L]', ' Show remotes '))
@@ -97,6 +134,12 @@ class Legends:
             else:
                 result.append(('[U]', ' Show upstreams '))
 
+        if divergenceLimited:
+            result.append(('[E]', ' Exact count '))
+
+        if commitGraphWanted:
+            result.append(('[G]', ' Write commit-graph '))
+
         result.append(('[Q]', ' Quit '))
 
         return result
@@ -106,30 +149,53 @@ class Legends:
         ('[ESC]', ' Quit and clear Filter ')
     ]
 
-class UI(ListViewDelegate, ListViewDataSource):
+    @staticmethod
+    def workspace(hasFilter, sordedDescending):
+        result = [
+            ('[UP]', ' Scroll up '),
+            ('[DOWN]', ' Scroll down '),
+            ('[ENTER]', ' Open repository '),
+        ]
+
+        if sordedDescending:
+            result.append(('[S]', ' Sort ascending '))
+        else:
+            result.append(('[S]', ' Sort descending '))
+
+        result.append(('[F]', ' Filter '))
+        if hasFilter:
+            result.append(('[C]', ' Clear Filter '))
 
-    def __init__(self, repo, keepOpen):
+        result.append(('[R]', ' Rescan '))
+        result.append(('[Q]', ' Quit '))
+
+        return result
+
+class BranchListUI(ListViewDelegate, ListViewDataSource):
+
+    def __init__(self):
+        super().__init__()
         self.errorMessage = None
-        self.__repo = repo
-        self.__filter = ''
-        self.__onlyLocal = True
-        self.__sortDescending = False
-        self.__keepOpen = keepOpen
         self.isFiltering = False
-        self.__showUpstreams = True
-        self.refreshList()
+        self.__loopRunning = False
 
-    def refreshList(self):
-        self.__branches = self.__repo.getBranches(local=self.__onlyLocal, remotes=not self.__onlyLocal)
-        self.__filteredBranches = self.__branches
-        remotes = self.__repo.remotes()
-        self.__maxRemoteNameLength = max([len(remote.name) for remote in remotes]) if len(remotes) else 0
-        self.sort()
-        self.applyFilter()
+    def setupScreen(self, stdscr):
+        self.setupColors()
+        self.__loopRunning = True
 
-    def fetchAll(self):
-        self.__repo.fetch()
-        self.refreshList()
+        self.window = DamageTrackingWindow(stdscr)
+        screen = ConstrainedBasedScreen(self.window)
+        self.legendElements = []
+        headerElements = self.addHeaderBox(screen)
+        listView = self.addListView(screen)
+
+        return (screen, headerElements, listView)
+
+    def isLoopRunning(self):
+        return self.__loopRunning
+
+    def stopLoop(self):
+        self.__loopRunning = False
 
     def setupColors(self):
         curses.curs_set(0)
@@ -147,13 +213,13 @@ class UI(ListViewDelegate, ListViewDataSource):
         curses.init_pair(Colorpairs.REMOTE, curses.COLOR_YELLOW, curses.COLOR_BLACK)
         curses.init_pair(Colorpairs.DIFF, curses.COLOR_MAGENTA, curses.COLOR_BLACK)
         curses.init_pair(Colorpairs.UPSTREAM, curses.COLOR_YELLOW, curses.COLOR_BLACK)
+        curses.init_pair(Colorpairs.MERGED, curses.COLOR_CYAN, curses.COLOR_BLACK)
 
         curses.init_pair(Colorpairs.CONFIRMATION, curses.COLOR_WHITE, curses.COLOR_RED)
         curses.init_pair(Colorpairs.CONFIRMATION_SELECTION, curses.COLOR_BLACK, curses.COLOR_WHITE)
 
         curses.init_pair(Colorpairs.VIEW, curses.COLOR_BLUE, curses.COLOR_WHITE)
 
-
     def addLegend(self, screen, legendItems):
         moreLabel = Label('')
 
@@ -195,7 +261,226 @@ class UI(ListViewDelegate, ListViewDataSource):
 
         screen.add_view(filterHBox, lambda w, h, v: (0, 0, w, 1))
 
-        return (filterBackground, filterHBox, filterCriteriaLabel, filterLabel)
+        fetchLabel = Label()
+        fetchLabel.attributes.append(curses.color_pair(Colorpairs.HEADER_TEXT))
+        screen.add_view(fetchLabel, lambda w, h, v: (w - v.required_size().width - 1, 0, v.required_size().width, 1))
+
+        return (filterBackground, filterHBox, filterCriteriaLabel, filterLabel, fetchLabel)
+
+    def addListView(self, screen):
+        listView = ListView(self, self)
+        screen.add_view(listView, lambda w, h, v: (0, 1, w, h-2))
+
+        return listView
+
+    def updateFilterLabels(self, filterCriteriaLabel, filterLabel):
+        filterLabel.text = self.getFilter()
+        filterCriteriaLabel.text = 'FILTER=' if len(self.getFilter()) > 0 or self.isFiltering else ''
+
+        filterCriteriaLabel.attributes.clear()
+        filterCriteriaLabel.attributes.append(curses.A_BOLD)
+        color = Colorpairs.FILTER_CRITERIA_EDITING if self.isFiltering else Colorpairs.FILTER_CRITERIA
+        filterCriteriaLabel.attributes.append(curses.color_pair(color))
+
+    def handleFilterKey(self, key):
+        if key == Keys.ESCAPE:
+            self.isFiltering = False
+            self.setFilter('')
+
+        elif key == Keys.ENTER:
+            self.isFiltering = False
+
+        elif key in [Keys.BACKSPACE, curses.KEY_BACKSPACE]:
+            self.setFilter(self.getFilter()[:-1])
+
+        elif key in [Keys.LEFT, Keys.RIGHT, Keys.UP, Keys.DOWN]:
+            pass
+
+        else:
+            self.setFilter(self.getFilter() + chr(key))
+
+    def handleListKey(self, key, listView):
+        if key == Keys.F:
+            self.isFiltering = True
+
+        if key == Keys.UP:
+            listView.select_previous()
+
+        if key == Keys.DOWN:
+            listView.select_next()
+
+        if key == Keys.C:
+            self.setFilter('')
+
+        if key == Keys.S:
+            self.toggleSortOrder()
+
+        if key == Keys.R:
+            self.refreshList()
+
+        if key == Keys.Q:
+            self.stopLoop()
+
+
+class UI(BranchListUI):
+
+    def __init__(self, repo, keepOpen, watch=True, base=None):
+        super().__init__()
+        self.__repo = repo
+        self.__filter = ''
+        self.__onlyLocal = True
+        self.__sortDescending = False
+        self.__keepOpen = keepOpen
+        self.__watch = watch
+        self.__watcher = None
+        self.__showUpstreams = True
+        self.__divergenceLoader = DivergenceLoader(repo)
+        self.__fetcher = RemoteFetcher(repo)
+        self.__graphWriter = CommitGraphWriter(repo)
+        self.__mergedLoader = MergedLoader(repo, base or repo.defaultBase())
+        # local branches marked for deletion, by refname
+        self.__marked = set()
+        # shown in the header until the next key is pressed
+        self.__statusMessage = None
+        self.__visibleBranches = []
+        self.__rowCache = RowCache()
+        self.__activeBranchName = repo.active_branch_name()
+        self.__branchLoader = None
+        self.__branchesVersion = 0
+        self.reloadList()
+
+    def refreshList(self):
+        # branches still loading cannot be updated in place
+        if self.__branchesLoading:
+            self.reloadList()
+            return
+
+        with profiler.phase('update branches'):
+            branches, changed = self.__repo.updateBranches(self.__branches, local=self.__onlyLocal, remotes=not self.__onlyLocal)
+
+        # remotes may have been added, renamed or removed since the list was loaded
+        self.updateMaxRemoteNameLength()
+        if changed:
+            self.setBranches(branches)
+
+    def reloadList(self):
+        self.__divergenceLoader.reset()
+        self.__rowCache.clear()
+        if self.__branchLoader:
+            self.__branchLoader.shutdown()
+
+        self.__branchLoader = BranchLoader(self.__repo, local=self.__onlyLocal, remotes=not self.__onlyLocal)
+        self.__branchesLoading = True
+        self.updateMaxRemoteNameLength()
+        self.setBranches([])
+
+    def updateMaxRemoteNameLength(self):
+        remotes = self.__repo.remotes()
+        self.__maxRemoteNameLength = max([len(remote.name) for remote in remotes]) if len(remotes) else 0
+
+    def setBranches(self, branches):
+        self.__branches = branches
+        self.__branchFilter = BranchFilter(self.__branches)
+        self.__branchesVersion += 1
+        self.__marked &= set(branch.refname for branch in branches)
+        self.applyFilter()
+
+        if self.__onlyLocal:
+            self.__mergedLoader.request()
+
+    def collectBranches(self):
+        # checked before collecting, so the last branches are not missed when loading finishes in between
+        loading = self.__branchLoader.isLoading()
+        arrived = self.__branchLoader.collect()
+        if arrived:
+            self.__branches += arrived
+            self.__branchFilter.add(arrived)
+            self.__branchesVersion += 1
+            self.applyFilter()
+
+        finished = self.__branchesLoading and not loading
+        self.__branchesLoading = loading
+        return len(arrived) > 0 or finished
+
+    def isLoadingBranches(self):
+        return self.__branchesLoading
+
+    def hasFirstPage(self, height):
+        return not self.__branchesLoading or len(self.__branches) >= height - 2
+
+    def fetchAll(self):
+        self.__fetcher.start()
+
+    def collectFetches(self):
+        completed = self.__fetcher.collect()
+        for _, movedRefnames in completed:
+            self.applyMovedRefs(movedRefnames)
+
+        return len(completed) > 0
+
+    def applyRefChanges(self):
+        if self.__branchesLoading:
+            self.reloadList()
+            return
+
+        # reading the tips is cheap, so they tell which of the branches changed
+        tips = self.__repo.refTips()
+        prefix = 'refs/heads/' if self.__onlyLocal else 'refs/remotes/'
+        known = { branch.refname: branch.commit for branch in self.__branches }
+        moved = set(refname for refname in set(known) | set(tips) if refname.startswith(prefix) and known.get(refname) != tips.get(refname))
+        moved.update(branch.upstreamRefname for branch in self.__branches if branch.upstreamRefname and branch.upstreamCommit != tips.get(branch.upstreamRefname))
+        self.applyMovedRefs(moved, tips)
+
+    def applyMovedRefs(self, movedRefnames, tips=None):
+        if not movedRefnames:
+            return
+
+        if self.__branchesLoading:
+            # branches still to come are read with their new tips, those already read could be anywhere
+            self.reloadList()
+            return
+
+        tips = tips or self.__repo.refTips()
+        for branch in self.__branches:
+            if branch.upstreamRefname in movedRefnames:
+                branch.refreshTips(tips)
+
+        prefix = 'refs/heads/' if self.__onlyLocal else 'refs/remotes/'
+        movedRefnames = [ refname for refname in movedRefnames if refname.startswith(prefix) ]
+        if not movedRefnames:
+            return
+
+        branches = { branch.refname: branch for branch in self.__branches }
+        for refname in movedRefnames:
+            branches.pop(refname, None)
+
+        for branch in self.__repo.getBranchesAt([ refname for refname in movedRefnames if refname in tips ], tips):
+            branches[branch.refname] = branch
+
+        self.setBranches(list(branches.values()))
+
+    def selectedBranch(self, listView):
+        index = listView.get_selected_row_index()
+        return self.__filteredBranches[index] if index < len(self.__filteredBranches) else None
+
+    def selectedRefname(self, listView):
+        branch = self.selectedBranch(listView)
+        return branch.refname if branch else None
+
+    def keepSelection(self, listView, refname, version):
+        # branches added or removed above the selected one shall neither move the selection nor scroll the list
+        if version == self.__branchesVersion or self.__branchesLoading or not self.__filteredBranches:
+            return
+
+        current = listView.get_selected_row_index()
+        index = next((i for i, branch in enumerate(self.__filteredBranches) if branch.refname == refname), None)
+        if index is None:
+            index = min(current, len(self.__filteredBranches) - 1)
+
+        for _ in range(current, index):
+            listView.select_next()
+        for _ in range(index, current):
+            listView.select_previous()
 
     def addTitle(self, screen):
         title_hbox = HBox()
@@ -207,7 +492,7 @@ class UI(ListViewDelegate, ListViewDataSource):
         directoryLabel.attributes.append(curses.A_BOLD)
         title_hbox.add_view(directoryLabel, Padding(0, 0, 0, 0))
 
-        activeBranchLabel = Label('[' + self.__repo.active_branch_name() + ']')
+        activeBranchLabel = Label('[' + self.__activeBranchName + ']')
         activeBranchLabel.attributes.append(curses.color_pair(Colorpairs.PATTERN))
         activeBranchLabel.attributes.append(curses.A_BOLD)
         title_hbox.add_view(activeBranchLabel, Padding(1, 0, 0, 0))
@@ -223,21 +508,10 @@ class UI(ListViewDelegate, ListViewDataSource):
         return (title_hbox, directoryLabel, activeBranchLabel, viewLabel)
 
     def updateHeaderBox(self, screen, filterElements):
-        _, _, filterCriteriaLabel, filterLabel = filterElements
-
-        filterLabel.text = self.__filter
+        _, _, filterCriteriaLabel, filterLabel, fetchLabel = filterElements
 
-        filterCriteria = 'FILTER='
-        if len(self.getFilter()) > 0:
-            filterCriteriaLabel.text = filterCriteria
-        else:
-            filterCriteriaLabel.text = filterCriteria if self.isFiltering else ''
-
-        filterCriteriaLabel.attributes.clear()
-        filterCriteriaLabel.attributes.append(curses.A_BOLD)
-        color = curses.color_pair(Colorpairs.FILTER_CRITERIA_EDITING) if self.isFiltering else curses.color_pair(
-            Colorpairs.FILTER_CRITERIA)
-        filterCriteriaLabel.attributes.append(color)
+        self.updateFilterLabels(filterCriteriaLabel, filterLabel)
+        fetchLabel.text = self.__statusMessage or self.__fetcher.status() or self.__graphWriter.status()
 
         screen.remove_views(self.titleElements)
         if len(self.getFilter()) == 0 and not self.isFiltering:
@@ -245,12 +519,6 @@ class UI(ListViewDelegate, ListViewDataSource):
         else:
             self.titleElements = []
 
-    def addListView(self, screen):
-        listView = ListView(self, self)
-        screen.add_view(listView, lambda w, h, v: (0, 1, w, h-2))
-
-        return listView
-
     def updateConfirmationLabels(self):
         _, _, noLabel, yesLabel = self.confirmationViews;
 
@@ -317,19 +585,40 @@ class UI(ListViewDelegate, ListViewDataSource):
     def merge(self, screen, branch):
         self.applyComfirmedAction(screen, lambda: self.performMerge(branch), 'Do you want to merge the selected branch into your active?')
 
-    def updateLegend(self, screen):
+    def updateLegend(self, screen, selectedBranch=None):
         screen.remove_views(self.legendElements)
 
         if self.isFiltering:
             legend = Legends.FILTER
         else:
             hasFilter = self.__filter and len(self.__filter)
-            legend = Legends.main(self.__onlyLocal, hasFilter, self.__showUpstreams, self.__sortDescending)
+            divergenceLimited = selectedBranch is not None and selectedBranch.isDivergenceLimited()
+            legend = Legends.main(self.__onlyLocal, hasFilter, self.__showUpstreams, self.__sortDescending, divergenceLimited, self.__graphWriter.isWanted(),
+                                  len(self.__marked), self.__mergedLoader.base)
 
         self.legendElements = self.addLegend(screen, legend)
 
+    def refusedByGit(self, branches, head):
+        # like git branch -d, which refuses branches not merged into their upstream, or HEAD if there is none
+        targets = {}
+        for branch in branches:
+            target = branch.upstreamCommit or head
+            if branch.commit and target:
+                targets.setdefault(target, []).append(branch)
+
+        # a single walk per upstream, or HEAD, answers for all branches checked against it
+        refused = set()
+        for target, checked in targets.items():
+            merged = self.__repo.mergedBranches(target)
+            refused.update(branch.refname for branch in checked if branch.refname not in merged)
+
+        return refused
+
     def deleteBranchConfirmed(self, screen, branch):
-        text = 'Do you really want to delete the selected branch?'
+        if self.refusedByGit([ branch ], self.__repo.resolve('HEAD')):
+            text = 'The selected branch is not fully merged, git will refuse to delete it. Try anyway?'
+        else:
+            text = 'Do you really want to delete the selected branch?'
         self.applyComfirmedAction(screen, lambda: self.deleteLocalBranch(branch), text)
 
     def deleteLocalBranch(self, branch):
@@ -345,32 +634,131 @@ class UI(ListViewDelegate, ListViewDataSource):
             self.errorMessage = e.stderr
             self.stopLoop()
 
-    def loop(self, stdscr):
+    def toggleMark(self, branch):
+        if branch.remote or branch.head == self.__activeBranchName:
+            return
 
-        self.setupColors()
-        self.__loopRunning = True
+        if branch.refname in self.__marked:
+            self.__marked.discard(branch.refname)
+        else:
+            self.__marked.add(branch.refname)
+
+    def markMerged(self):
+        # only the branches passing the filter, so e.g. feature/ narrows down what is cleaned up
+        merged = set(branch.refname for branch in self.__filteredBranches if branch.refname in self.__mergedLoader.merged
+                     and not branch.remote and branch.head not in (self.__activeBranchName, self.__mergedLoader.base))
+        if merged <= self.__marked:
+            self.__marked -= merged
+        else:
+            self.__marked |= merged
+
+    def deleteMarkedConfirmed(self, screen):
+        # branches merged into the base are not necessarily merged into what git branch -d checks against
+        head = self.__repo.resolve('HEAD')
+        branches = [ branch for branch in self.__branches if branch.refname in self.__marked ]
+        refusedRefnames = self.refusedByGit(branches, head)
+        refused = [ branch for branch in branches if branch.refname in refusedRefnames ]
+        deletable = [ branch for branch in branches if branch.refname not in refusedRefnames ]
+        refusedNames = ', '.join(branch.head for branch in refused)
+
+        if not deletable:
+            self.__statusMessage = 'not fully merged, git would refuse to delete: {}'.format(refusedNames)
+            return
+
+        if refused:
+            text = 'Delete {} of the marked branches? Not fully merged and kept: {}'.format(len(deletable), refusedNames)
+        else:
+            text = 'Do you really want to delete the {} marked branches?'.format(len(deletable))
+        self.applyComfirmedAction(screen, lambda: self.deleteLocalBranches(deletable), text)
+
+    def deleteLocalBranches(self, branches):
+        # a single git branch -d for all of them, followed by a single refresh, which also drops the marks of the deleted ones
+        try:
+            self.__repo.repo.git.branch('-d', *[ branch.head for branch in branches ])
+            self.__statusMessage = 'deleted {} branches'.format(len(branches))
+        except GitCommandError as e:
+            # git deletes all branches it can before failing on the others, which stay marked
+            self.__statusMessage = gitErrors(e)
+
+        self.refreshList()
+
+    def loop(self, stdscr):
 
-        screen = ConstrainedBasedScreen(stdscr)
         self.titleElements = []
-        self.legendElements = []
-        headerElements = self.addHeaderBox(screen)
-        listView = self.addListView(screen)
+        screen, headerElements, listView = self.setupScreen(stdscr)
 
         self.confirmationActive = False
         self.confirmationYesSelected = False
         self.confirmationAction = None
 
-        while self.__loopRunning:
-            self.updateHeaderBox(screen, headerElements)
-            if not self.confirmationActive:
-                self.updateLegend(screen)
+        if self.__watch:
+            self.__watcher = RepositoryWatcher(self.__repo)
+
+        needsRender = True
+        while self.isLoopRunning():
+            selectedRefname = self.selectedRefname(listView)
+            version = self.__branchesVersion
+
+            if self.collectBranches():
+                needsRender = True
 
-            screen.render()
+            changes = self.__watcher.collect() if self.__watcher else None
+            if changes:
+                with profiler.acting('watch'):
+                    self.applyRefChanges()
+                needsRender = True
+
+            if self.__divergenceLoader.collect():
+                needsRender = True
+
+            if self.collectFetches():
+                needsRender = True
+
+            if self.__graphWriter.collect():
+                needsRender = True
+
+            if self.__mergedLoader.collect():
+                needsRender = True
+
+            self.keepSelection(listView, selectedRefname, version)
+
+            # while branches are still being read, nothing is shown until they fill the screen
+            firstPage = self.hasFirstPage(stdscr.getmaxyx()[0])
+            if needsRender and firstPage:
+                self.__activeBranchName = self.__repo.active_branch_name()
+                self.updateHeaderBox(screen, headerElements)
+                if not self.confirmationActive:
+                    self.updateLegend(screen, self.selectedBranch(listView))
+
+                self.__visibleBranches = []
+                with profiler.phase('render'):
+                    screen.render()
+                needsRender = False
+
+                self.__divergenceLoader.request(self.__visibleBranches)
+
+            busy = self.__branchesLoading or self.__divergenceLoader.isLoading() or self.__fetcher.isRunning() or self.__graphWriter.isRunning() \
+                or self.__mergedLoader.isLoading()
+            if not firstPage:
+                stdscr.timeout(Timeouts.FIRST_PAGE)
+            elif busy:
+                stdscr.timeout(Timeouts.LOADING)
+            else:
+                stdscr.timeout(Timeouts.WATCHING if self.__watcher else Timeouts.IDLE)
 
             key = stdscr.getch()
+            if key == curses.ERR:
+                continue
+
+            profiler.setAction(profiler.keyAction(key))
+            needsRender = True
             if key == curses.KEY_RESIZE:
                 continue
 
+            self.__statusMessage = None
+            selectedRefname = self.selectedRefname(listView)
+            version = self.__branchesVersion
+
             if self.confirmationActive:
                 if key == Keys.LEFT:
                     self.confirmationYesSelected = False
@@ -386,24 +774,7 @@ class UI(ListViewDelegate, ListViewDataSource):
                         self.confirmationAction()
 
             elif self.isFiltering:
-                if key == Keys.ESCAPE:
-                    self.isFiltering = False
-                    self.setFilter('')
-
-                elif key == Keys.ENTER:
-                    self.isFiltering = False
-                    if len(self.getFilter()) == 0:
-                        self.clearFilter()
-
-                elif key == Keys.BACKSPACE:
-                    self.setFilter(self.getFilter()[:-1])
-
-                elif key in [Keys.LEFT, Keys.RIGHT, Keys.UP, Keys.DOWN]:
-                    pass
-
-                else:
-                    character = chr(key)
-                    self.setFilter(self.getFilter() + character)
+                self.handleFilterKey(key)
 
             else:
                 selectedIndex = listView.get_selected_row_index()
@@ -412,50 +783,55 @@ class UI(ListViewDelegate, ListViewDataSource):
                 if key == Keys.ENTER and branch:
                     self.checkoutSelectedBranch(screen, branch)
 
-                if key == Keys.F:
-                    self.isFiltering = True
-
-                if key == Keys.UP:
-                    listView.select_previous()
-
-                if key == Keys.DOWN:
-                    listView.select_next()
+                self.handleListKey(key, listView)
 
                 if key == Keys.T and branch:
                     if branch.remote:
                         self.trackRemoteBranch(branch)
 
-                if key == Keys.C:
-                    self.clearFilter()
-
                 if key == Keys.L:
                     self.toggleLocalOnly()
 
-                if key == Keys.S:
-                    self.toggleSortOrder()
-
-                if key == Keys.R:
-                    self.refreshList()
-
                 if key == Keys.A:
                     self.fetchAll()
 
                 if key == Keys.M and branch:
                     self.merge(screen, branch)
 
-                if key == Keys.Q:
-                    self.stopLoop()
-
-                if key == Keys.D and branch:
-                    if not branch.remote:
+                if key == Keys.D and self.__onlyLocal:
+                    if self.__marked:
+                        self.deleteMarkedConfirmed(screen)
+                    elif branch and not branch.remote:
                         self.deleteBranchConfirmed(screen, branch)
 
+                if key == Keys.SPACE and branch:
+                    self.toggleMark(branch)
+
+                if key == Keys.X and self.__onlyLocal:
+                    self.markMerged()
+
                 if key == Keys.U:
                     self.__showUpstreams = not self.__showUpstreams
 
+                if key == Keys.E and branch:
+                    self.__divergenceLoader.requestExact(branch)
+
+                if key == Keys.G:
+                    self.__graphWriter.start()
+
+            self.keepSelection(listView, selectedRefname, version)
+
+        self.__branchLoader.shutdown()
+        self.__divergenceLoader.shutdown()
+        self.__fetcher.shutdown()
+        self.__graphWriter.shutdown()
+        self.__mergedLoader.shutdown()
+        if self.__watcher:
+            self.__watcher.shutdown()
+
     def checkoutSelectedBranch(self, screen, branch):
-        if branch.reference == self.__repo.active_branch():
-            self.errorMessage = 'error: Branch \'{}\' is already your active branch.\n'.format(branch.reference)
+        if branch.getReference() == self.__repo.active_branch():
+            self.errorMessage = 'error: Branch \'{}\' is already your active branch.\n'.format(branch.getReference())
 
         elif branch.remote:
             text = 'Checking out a remote branch will result in a detached head. Continue?'
@@ -465,7 +841,7 @@ class UI(ListViewDelegate, ListViewDataSource):
 
     def checkoutBranch(self, branch):
         try:
-            branch.reference.checkout()
+            branch.getReference().checkout()
         except GitCommandError as e:
             self.errorMessage = e.stderr
 
@@ -488,9 +864,6 @@ class UI(ListViewDelegate, ListViewDataSource):
         else:
             self.stopLoop()
 
-    def stopLoop(self):
-        self.__loopRunning = False
-
     def getFilter(self):
         return self.__filter
 
@@ -498,25 +871,26 @@ class UI(ListViewDelegate, ListViewDataSource):
         self.__filter = filter
         self.applyFilter()
 
-    def clearFilter(self):
-        self.setFilter('')
-
     def applyFilter(self):
-        self.__filteredBranches = list(filter(lambda item: self.__filter.lower() in item.head.lower(), self.__branches))
-        self.sort()
+        with profiler.phase('sort and filter', query=self.__filter):
+            self.__filteredBranches = self.__branchFilter.apply(self.__filter, self.__sortDescending)
 
     def toggleLocalOnly(self):
         self.__onlyLocal = not self.__onlyLocal
-        self.refreshList()
-
-    def sort(self):
-        self.__filteredBranches = sorted(self.__filteredBranches, key=lambda branch: branch.head, reverse=self.__sortDescending)
+        self.reloadList()
 
     def toggleSortOrder(self):
         self.__sortDescending = not self.__sortDescending
-        self.sort()
+        self.applyFilter()
 
     def build_row(self, i, data, is_selected, width) -> View:
+        self.__visibleBranches.append(data)
+        merged = data.refname in self.__mergedLoader.merged
+        marked = data.refname in self.__marked
+        key = (is_selected, width, data.pending, data.diff, self.__showUpstreams, self.__activeBranchName, merged, marked, self.__maxRemoteNameLength)
+        return self.__rowCache.get(data, key, lambda: self.buildBranchRow(data, is_selected, merged, marked))
+
+    def buildBranchRow(self, data, is_selected, merged=False, marked=False) -> View:
         rowHBox = HBox()
 
         if data.remote:
@@ -528,8 +902,8 @@ class UI(ListViewDelegate, ListViewDataSource):
             remoteLabel.attributes.append(curses.color_pair(Colorpairs.REMOTE))
             remoteLabel.attributes.append(curses.A_BOLD)
 
-        isCheckedOut = data.head == self.__repo.active_branch_name() and not data.remote
-        checkedOutPrefix = '*' if isCheckedOut else ' '
+        isCheckedOut = data.head == self.__activeBranchName and not data.remote
+        checkedOutPrefix = '*' if isCheckedOut else '×' if marked else ' '
         headLabel = Label(checkedOutPrefix+data.head)
         rowHBox.add_view(headLabel, Padding(2, 0, 0, 0))
 
@@ -542,11 +916,200 @@ class UI(ListViewDelegate, ListViewDataSource):
                 upstreamLabel.attributes.append(curses.color_pair(Colorpairs.UPSTREAM))
                 rowHBox.add_view(upstreamLabel, Padding(1, 0, 0, 0))
 
-            diffLabel = Label(data.diff)
+            diffLabel = Label('…' if data.pending else data.diff)
             diffLabel.attributes.append(curses.color_pair(Colorpairs.DIFF))
             diffLabel.attributes.append(curses.A_BOLD)
             rowHBox.add_view(diffLabel, Padding(2, 0, 0, 0))
 
+            if merged:
+                mergedLabel = Label('merged')
+                mergedLabel.attributes.append(curses.color_pair(Colorpairs.MERGED))
+                rowHBox.add_view(mergedLabel, Padding(2, 0, 0, 0))
+
+        result = rowHBox
+        if is_selected:
+            result = BackgroundView(curses.color_pair(Colorpairs.SELECTED))
+            result.add_view(rowHBox)
+            for label in rowHBox.get_elements():
+                label.attributes.append(curses.color_pair(Colorpairs.SELECTED))
+
+        return result
+
+    def number_of_rows(self) -> int:
+        return len(self.__filteredBranches)
+
+    def get_data(self, i) -> object:
+        return self.__filteredBranches[i]
+
+
+class WorkspaceUI(BranchListUI):
+
+    def __init__(self, directory, keepOpen, watch=True, divergenceLimit=Repository.DIVERGENCE_LIMIT, base=None):
+        super().__init__()
+        self.__directory = directory
+        self.__keepOpen = keepOpen
+        self.__watch = watch
+        self.__divergenceLimit = divergenceLimit
+        self.__base = base
+        self.__filter = ''
+        self.__sortDescending = False
+        self.__loader = None
+        self.__rowCache = RowCache()
+        self.refreshList()
+
+    def refreshList(self):
+        if self.__loader:
+            self.__loader.shutdown()
+
+        self.__loader = WorkspaceLoader(self.__directory, loadBranches)
+        self.__branches = []
+        self.__maxRepositoryNameLength = 0
+        self.__rowCache.clear()
+        self.__branchFilter = BranchFilter(self.__branches)
+        self.applyFilter()
+
+    def collectRepositories(self):
+        results = self.__loader.collect()
+        for repository, branches in results:
+            self.__branches = [ branch for branch in self.__branches if branch.repository != repository ] + branches
+            self.__maxRepositoryNameLength = max(self.__maxRepositoryNameLength, len(self.repositoryName(repository)))
+
+        if results:
+            self.__branchFilter = BranchFilter(self.__branches)
+            self.applyFilter()
+
+        return len(results) > 0
+
+    def repositoryName(self, repository):
+        return os.path.relpath(repository, self.__directory)
+
+    def getFilter(self):
+        return self.__filter
+
+    def setFilter(self, filter):
+        self.__filter = filter
+        self.applyFilter()
+
+    def applyFilter(self):
+        with profiler.phase('sort and filter', query=self.__filter):
+            ranked = self.__branchFilter.apply(self.__filter, self.__sortDescending)
+            self.__filteredBranches = sorted(ranked, key=lambda branch: branch.repository)
+
+    def toggleSortOrder(self):
+        self.__sortDescending = not self.__sortDescending
+        self.applyFilter()
+
+    def loadingStatus(self):
+        if self.__loader.isLoading():
+            return 'loading {}/{} repositories'.format(self.__loader.loaded, self.__loader.discovered)
+
+        if self.__loader.failed:
+            return '{} repositories failed to load'.format(len(self.__loader.failed))
+
+        return ''
+
+    def updateWorkspaceHeader(self, screen, headerElements, titleLabel):
+        _, _, filterCriteriaLabel, filterLabel, statusLabel = headerElements
+
+        self.updateFilterLabels(filterCriteriaLabel, filterLabel)
+        statusLabel.text = self.loadingStatus()
+
+        hasFilter = len(self.__filter) > 0
+        titleLabel.text = '' if hasFilter or self.isFiltering else shortenPath(Path(self.__directory))
+
+        screen.remove_views(self.legendElements)
+        legend = Legends.FILTER if self.isFiltering else Legends.workspace(hasFilter, self.__sortDescending)
+        self.legendElements = self.addLegend(screen, legend)
+
+    def openRepository(self, stdscr, branch):
+        repo = Repository(branch.repository)
+        repo.divergenceLimit = self.__divergenceLimit
+        if repo.hasDetachedHead():
+            return
+
+        ui = UI(repo, self.__keepOpen, self.__watch, self.__base)
+        ui.loop(stdscr)
+        if ui.errorMessage:
+            self.errorMessage = ui.errorMessage
+
+        self.window.invalidate()
+        self.__loader.reload(branch.repository)
+
+    def loop(self, stdscr):
+
+        screen, headerElements, listView = self.setupScreen(stdscr)
+
+        titleLabel = Label()
+        titleLabel.attributes.append(curses.color_pair(Colorpairs.HEADER_TEXT))
+        titleLabel.attributes.append(curses.A_BOLD)
+        screen.add_view(titleLabel, lambda w, h, v: ((w - v.required_size().width) // 2, 0, v.required_size().width + 1, 1))
+
+        needsRender = True
+        while self.isLoopRunning():
+            if self.collectRepositories():
+                needsRender = True
+
+            if needsRender:
+                self.updateWorkspaceHeader(screen, headerElements, titleLabel)
+                with profiler.phase('render'):
+                    screen.render()
+                needsRender = False
+
+            loading = self.__loader.isLoading()
+            stdscr.timeout(Timeouts.LOADING if loading else Timeouts.IDLE)
+
+            key = stdscr.getch()
+            if key == curses.ERR:
+                # the status line changes while repositories are being discovered
+                needsRender = loading
+                continue
+
+            profiler.setAction(profiler.keyAction(key))
+            needsRender = True
+            if key == curses.KEY_RESIZE:
+                continue
+
+            if self.isFiltering:
+                self.handleFilterKey(key)
+
+            else:
+                selectedIndex = listView.get_selected_row_index()
+                branch = self.__filteredBranches[selectedIndex] if selectedIndex < len(self.__filteredBranches) else None
+
+                if key == Keys.ENTER and branch:
+                    self.openRepository(stdscr, branch)
+
+                self.handleListKey(key, listView)
+
+        self.__loader.shutdown()
+
+    def build_row(self, i, data, is_selected, width) -> View:
+        key = (is_selected, width, self.__maxRepositoryNameLength)
+        return self.__rowCache.get(data, key, lambda: self.buildWorkspaceRow(data, is_selected))
+
+    def buildWorkspaceRow(self, data, is_selected) -> View:
+        rowHBox = HBox()
+
+        repositoryName = '[{}]'.format(self.repositoryName(data.repository))
+        repositoryLabel = Label(repositoryName.ljust(self.__maxRepositoryNameLength + 2))
+        repositoryLabel.attributes.append(curses.color_pair(Colorpairs.REMOTE))
+        repositoryLabel.attributes.append(curses.A_BOLD)
+        rowHBox.add_view(repositoryLabel, Padding(2, 0, 0, 0))
+
+        headLabel = Label(('*' if data.active else ' ') + data.head)
+        if data.active:
+            headLabel.attributes.append(curses.color_pair(Colorpairs.ACTIVE))
+        rowHBox.add_view(headLabel, Padding(2, 0, 0, 0))
+
+        upstreamLabel = Label('-> {}'.format(data.upstream))
+        upstreamLabel.attributes.append(curses.color_pair(Colorpairs.UPSTREAM))
+        rowHBox.add_view(upstreamLabel, Padding(1, 0, 0, 0))
+
+        diffLabel = Label(data.diff)
+        diffLabel.attributes.append(curses.color_pair(Colorpairs.DIFF))
+        diffLabel.attributes.append(curses.A_BOLD)
+        rowHBox.add_view(diffLabel, Padding(2, 0, 0, 0))
+
         result = rowHBox
         if is_selected:
             result = BackgroundView(curses.color_pair(Colorpairs.SELECTED))
@@ -563,6 +1126,13 @@ class UI(ListViewDelegate, ListViewDataSource):
         return self.__filteredBranches[i]
 
 
+def nonNegativeInt(value):
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError('must not be negative, got {}'.format(value))
+    return number
+
+
 def parseArguments():
     argparser = argparse.ArgumentParser(
         prog='branches',
@@ -578,17 +1148,105 @@ def parseArguments():
         help="The app stays open after checking out a branch",
         action="store_true"
     )
+    argparser.add_argument(
+        '-w',
+        '--workspace',
+        help="Treats PATH as a workspace and shows the local branches of all git repositories found below it",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '-s',
+        '--stats',
+        help="Prints how many git processes were spawned and screen cells were redrawn during the session on exit",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--no-watch',
+        help="Does not watch the repository for branches changed outside the tool, which then only show up after [R]",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--divergence-limit',
+        help="Commits ahead or behind are only counted up to this number and shown as e.g. 999+, [E] counts them exactly for the selected branch. 0 counts all of them",
+        type=nonNegativeInt,
+        default=Repository.DIVERGENCE_LIMIT
+    )
+    argparser.add_argument(
+        '--base',
+        help="The branch local branches are checked for being merged into, e.g. develop. Defaults to main, master or develop, whichever exists first"
+    )
+    argparser.add_argument(
+        '--json',
+        help="Skips the interactive UI and streams all local and remote branches as JSON, one object per line, as they are read",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--profile',
+        help="Records every git invocation and the time spent building, filtering and rendering branches as a trace file and prints a summary on exit",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--trace',
+        help="Where the trace of --profile is written to. Defaults to a file in the temporary directory."
+    )
     return argparser.parse_args()
 
 
+def branchRecords(directories, workspace):
+    for directory in directories:
+        try:
+            for record in Repository(directory).streamBranches(local=True, remotes=True):
+                result = record.toDict()
+                if workspace:
+                    result['repository'] = directory
+                yield result
+        except (GitCommandError, InvalidGitRepositoryError) as e:
+            print('{}: {}'.format(directory, e), file=sys.stderr)
+
+def printProcessStatistics(repo):
+    spawned = repo.spawnedProcesses()
+    print('git processes spawned: {}'.format(sum(spawned.values())), file=sys.stderr)
+    for command, count in spawned.most_common():
+        print('  {:<16} {:>6}'.format(command, count), file=sys.stderr)
+
+def printRenderStatistics(window):
+    average = window.redrawnCells / window.frames if window.frames else 0
+    print('frames rendered: {}, cells redrawn: {} ({:.1f} per frame)'.format(window.frames, window.redrawnCells, average), file=sys.stderr)
+
+
 if __name__ == '__main__':
     args = parseArguments()
 
+    if args.profile:
+        profiler.enable()
+
     if args.PATH:
         repositoryDirectory = os.path.abspath(args.PATH)
     else:
         repositoryDirectory = os.getcwd()
+
+    if args.json:
+        directories = discoverRepositories(repositoryDirectory) if args.workspace else [repositoryDirectory]
+        ndjson.write(branchRecords(directories, args.workspace))
+        if args.profile:
+            profiler.finish(args.trace or profiler.defaultTracePath('branches'))
+        exit(0)
+
+    if args.workspace:
+        ui = WorkspaceUI(repositoryDirectory, args.keep_open, not args.no_watch, args.divergence_limit, args.base)
+        curses.wrapper(ui.loop)
+
+        if ui.errorMessage:
+            print(ui.errorMessage, file=sys.stderr)
+
+        if args.stats:
+            printRenderStatistics(ui.window)
+        if args.profile:
+            profiler.finish(args.trace or profiler.defaultTracePath('branches'))
+        exit(0)
+
     repo = Repository(repositoryDirectory)
+    repo.divergenceLimit = args.divergence_limit
 
     if repo.hasDetachedHead():
         shortPath = shortenPath(Path(repositoryDirectory))
@@ -596,8 +1254,15 @@ if __name__ == '__main__':
         print(message, file=sys.stderr)
         exit(-1)
 
-    ui = UI(repo, args.keep_open)
+    ui = UI(repo, args.keep_open, not args.no_watch, args.base)
     curses.wrapper(ui.loop)
 
     if ui.errorMessage:
-        print(ui.errorMessage, file=sys.stderr)
\ No newline at end of file
+        print(ui.errorMessage, file=sys.stderr)
+
+    if args.stats:
+        printProcessStatistics(repo)
+        printRenderStatistics(ui.window)
+
+    if args.profile:
+        profiler.finish(args.trace or profiler.defaultTracePath('branches'))
\ No newline at end of file
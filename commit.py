@@ -1,5 +1,6 @@
 import argparse
 import os
+from utils import profiler
 from utils.git import Stage
 from subprocess import call
 
@@ -26,6 +27,15 @@ def parseArguments():
         help="Verify hooks will be bypassed. This effects both commit and possible push hooks.",
         action="store_true"
     )
+    argparser.add_argument(
+        '--profile',
+        help="Records every git invocation as a trace file and prints a summary on exit.",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--trace',
+        help="Where the trace of --profile is written to. Defaults to a file in the temporary directory."
+    )
     args = argparser.parse_args()
     return args
 
@@ -36,7 +46,8 @@ def commit(content='', noVerify=False):
     tmpFile.close()
 
     command = ['git', 'commit', '-t', tmpFilePath]
-    returnCode = call(command)
+    with profiler.command('commit', ' '.join(command[1:])):
+        returnCode = call(command)
 
     os.remove(tmpFilePath)
 
@@ -47,13 +58,17 @@ def push(noVerify=False):
     if noVerify:
         command.append('--no-verify')
 
-    returnCode = call(command)
+    with profiler.command('push', ' '.join(command[1:])):
+        returnCode = call(command)
 
     return returnCode == 0
 
 if __name__ == '__main__':
     args = parseArguments()
 
+    if args.profile:
+        profiler.enable()
+
     commitSuccessful = False
     if args.empty:
         commitSuccessful = commit(noVerify=args.no_verify)
@@ -72,4 +87,7 @@ if __name__ == '__main__':
 
 
     if commitSuccessful and args.push:
-        push(args.no_verify)
\ No newline at end of file
+        push(args.no_verify)
+
+    if args.profile:
+        profiler.finish(args.trace or profiler.defaultTracePath('commit'))
\ No newline at end of file
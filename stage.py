@@ -1,11 +1,21 @@
+import argparse
 import curses
+import fnmatch
+import heapq
 import os
+import sys
 from pathlib import Path
 
+from git import GitCommandError, InvalidGitRepositoryError
 from gupy.geometry import Padding
 from gupy.screen import ConstrainedBasedScreen
 from gupy.view import ListView, Label, HBox, BackgroundView
 from utils.git import Stage
+from utils.rowcache import RowCache
+from utils.damage import DamageTrackingWindow
+from utils.watcher import RepositoryWatcher
+from utils.workspace import WorkspaceLoader, loadStatus, discoverRepositories
+from utils import ndjson, profiler
 
 KEY_SPACE=ord(' ')
 KEY_ENTER=ord('\n')
@@ -16,6 +26,12 @@ KEY_A=ord('a')
 KEY_I=ord('i')
 KEY_S=ord('s')
 KEY_P=ord('p')
+KEY_M=ord('m')
+KEY_V=ord('v')
+KEY_G=ord('g')
+KEY_U=ord('u')
+KEY_ESCAPE=27
+KEY_BACKSPACE=127
 
 COLOR_PAIR_DEFAULT=0
 COLOR_PAIR_TITLE=1
@@ -31,9 +47,14 @@ COLOR_PAIR_UNTRACKED=10
 COLOR_PAIR_STAGED=11
 COLOR_PAIR_CONFIRMATION=12
 COLOR_PAIR_CONFIRMATION_SELECTION=13
+COLOR_PAIR_GLOB=14
 
 LEGEND=[
-    ('[SPACE]', ' Toggle file '),
+    ('[SPACE]', ' Toggle file(s) '),
+    ('[M]', ' Mark '),
+    ('[V]', ' Mark range '),
+    ('[G]', ' Mark glob '),
+    ('[U]', ' Unmark all '),
     ('[A]', ' Toggle all '),
     ('[I]', ' Ignore file '),
     ('[S]', ' Stash all '),
@@ -43,12 +64,62 @@ LEGEND=[
     ('[Q]', ' Quit ')
 ]
 
+WORKSPACE_LEGEND=[
+    ('[ENTER]', ' Open repository '),
+    ('[R]', ' Rescan '),
+    ('[Q]', ' Quit ')
+]
+
+WORKSPACE_JOBS=4
+LOADING_TIMEOUT=100
+WATCH_TIMEOUT=250
+# more changed paths than that are cheaper to pick up with a single full status
+WATCHED_PATHS_LIMIT=200
+
 
 class TableViewDelegate:
 
     def __init__(self, change_type_colors, files=[]):
         self.change_type_colors = change_type_colors
         self.files = files
+        self.marked = set()
+        self.mark_anchor = None
+        self.row_cache = RowCache()
+
+    def __mark_key(self, file):
+        return (file.get_relative_path(), file.is_staged())
+
+    def is_marked(self, file):
+        return self.__mark_key(file) in self.marked
+
+    def toggle_mark(self, i):
+        if not self.files:
+            return
+
+        key = self.__mark_key(self.files[i])
+        if key in self.marked:
+            self.marked.remove(key)
+        else:
+            self.marked.add(key)
+        self.mark_anchor = i
+
+    def mark_range(self, i):
+        anchor = self.mark_anchor if self.mark_anchor is not None else i
+        for file in self.files[min(anchor, i):max(anchor, i)+1]:
+            self.marked.add(self.__mark_key(file))
+        self.mark_anchor = i
+
+    def mark_glob(self, pattern):
+        for file in self.files:
+            if fnmatch.fnmatch(file.get_relative_path(), pattern):
+                self.marked.add(self.__mark_key(file))
+
+    def clear_marks(self):
+        self.marked = set()
+        self.mark_anchor = None
+
+    def marked_files(self):
+        return [file for file in self.files if self.is_marked(file)]
 
     def number_of_rows(self):
         return len(self.files)
@@ -56,14 +127,46 @@ class TableViewDelegate:
     def get_data(self, i):
         return self.files[i]
 
+    def replace_path(self, i, files):
+        path = self.files[i].get_relative_path()
+
+        start = i
+        while start > 0 and self.files[start-1].get_relative_path() == path:
+            start -= 1
+
+        end = i
+        while end < len(self.files) and self.files[end].get_relative_path() == path:
+            end += 1
+
+        self.files[start:end] = files
+
+    def replace_paths(self, paths, files):
+        def is_replaced(path):
+            while path:
+                if path in paths:
+                    return True
+                path = path.rpartition('/')[0]
+            return False
+
+        kept = [file for file in self.files if not is_replaced(file.get_relative_path())]
+        self.files = list(heapq.merge(kept, files, key=lambda file: file.get_relative_path()))
+
     def build_row(self, i, file, is_selected, width):
+        key = (is_selected, width, self.is_marked(file))
+        return self.row_cache.get(file, key, lambda: self.build_file_row(file, is_selected, width))
+
+    def build_file_row(self, file, is_selected, width):
         hbox = HBox()
 
+        mark_label = Label('*' if self.is_marked(file) else ' ')
+        mark_label.attributes.append(curses.A_BOLD)
+        hbox.add_view(mark_label, Padding(1, 0, 0, 0))
+
         staged_char = '+'
         if file.is_staged() is not True:
             staged_char = ' '
         staged_label = Label(staged_char)
-        hbox.add_view(staged_label, Padding(2, 0, 0, 0))
+        hbox.add_view(staged_label, Padding(0, 0, 0, 0))
 
         change_type = file.get_change_type()
         change_type_label = Label(change_type)
@@ -93,10 +196,67 @@ class TableViewDelegate:
         return result
 
 
-def main(stdscr):
-    repository_directory = os. getcwd()
-    stage = Stage(repository_directory)
+class WorkspaceDelegate:
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.statuses = {}
+        self.repositories = []
+        self.row_cache = RowCache()
+
+    def clear(self):
+        self.statuses = {}
+        self.repositories = []
+
+    def update(self, status):
+        if status.hasChanges():
+            self.statuses[status.repository] = status
+        else:
+            self.statuses.pop(status.repository, None)
+        self.repositories = sorted(self.statuses)
+
+    def number_of_rows(self):
+        return len(self.repositories)
+
+    def get_data(self, i):
+        return self.statuses[self.repositories[i]]
 
+    def build_row(self, i, status, is_selected, width):
+        return self.row_cache.get(status, (is_selected, width), lambda: self.build_status_row(status, is_selected))
+
+    def build_status_row(self, status, is_selected):
+        hbox = HBox()
+
+        repository_label = Label(os.path.relpath(status.repository, self.directory))
+        repository_label.attributes.append(curses.A_BOLD)
+        hbox.add_view(repository_label, Padding(2, 0, 0, 0))
+
+        branch_label = Label('[{}]'.format(status.branch) if status.branch else '(detached)')
+        branch_label.attributes.append(curses.color_pair(COLOR_PAIR_MOVED))
+        hbox.add_view(branch_label, Padding(1, 0, 0, 0))
+
+        counts = [
+            (status.staged, '+{} staged', COLOR_PAIR_STAGED),
+            (status.unstaged, '~{} unstaged', COLOR_PAIR_MODIFIED),
+            (status.untracked, '?{} untracked', COLOR_PAIR_UNTRACKED)
+        ]
+        for count, text, color in counts:
+            if count:
+                count_label = Label(text.format(count))
+                count_label.attributes.append(curses.color_pair(color))
+                hbox.add_view(count_label, Padding(2, 0, 0, 0))
+
+        result = hbox
+        if is_selected:
+            result = BackgroundView(curses.color_pair(COLOR_PAIR_SELECTED))
+            result.add_view(hbox)
+            for label in hbox.get_elements():
+                label.attributes.append(curses.color_pair(COLOR_PAIR_SELECTED))
+
+        return result
+
+
+def init_colors():
     curses.curs_set(0)
     curses.init_pair(COLOR_PAIR_TITLE, curses.COLOR_BLACK, curses.COLOR_WHITE)
     curses.init_pair(COLOR_PAIR_KEY, curses.COLOR_BLACK, curses.COLOR_CYAN)
@@ -113,6 +273,37 @@ def main(stdscr):
     curses.init_pair(COLOR_PAIR_STAGED, curses.COLOR_GREEN, curses.COLOR_BLACK)
     curses.init_pair(COLOR_PAIR_CONFIRMATION, curses.COLOR_WHITE, curses.COLOR_RED)
     curses.init_pair(COLOR_PAIR_CONFIRMATION_SELECTION, curses.COLOR_BLACK, curses.COLOR_WHITE)
+    curses.init_pair(COLOR_PAIR_GLOB, curses.COLOR_BLACK, curses.COLOR_MAGENTA)
+
+
+def add_legend(screen, legend):
+    more_label = Label('')
+    legend_hbox = HBox()
+    def set_more_label(clipped):
+        if clipped:
+            more_label.text = '...'
+        else:
+            more_label.text = ''
+
+    legend_hbox.clipping_callback = set_more_label
+    for key, description in legend:
+        key_label = Label(key)
+        key_label.attributes.append(curses.color_pair(COLOR_PAIR_KEY))
+        legend_hbox.add_view(key_label, Padding(2, 0, 0, 0))
+
+        description_label = Label(description)
+        description_label.attributes.append(curses.color_pair(COLOR_PAIR_DESCRIPTION))
+        legend_hbox.add_view(description_label, Padding(0, 0, 0, 0))
+
+    screen.add_view(legend_hbox, lambda w, h, v: (0, h-1, w-more_label.required_size().width, 1))
+    screen.add_view(more_label, lambda  w, h, v: (w-v.required_size().width-1, h-1, v.required_size().width, 1))
+
+
+def main(stdscr, stage, watch=True):
+    repository_directory = stage.getDirectory()
+    window = DamageTrackingWindow(stdscr)
+
+    init_colors()
 
     change_type_colors = {
         'A': curses.color_pair(COLOR_PAIR_ADDED),
@@ -124,7 +315,7 @@ def main(stdscr):
         '?': curses.color_pair(COLOR_PAIR_UNTRACKED)
     }
 
-    screen = ConstrainedBasedScreen(stdscr)
+    screen = ConstrainedBasedScreen(window)
     title_background = BackgroundView(curses.color_pair(COLOR_PAIR_TITLE))
     screen.add_view(title_background, lambda w, h, v: (0, 0, w, 1))
 
@@ -149,32 +340,46 @@ def main(stdscr):
     title_hbox.add_view(branch_label, Padding(1, 0, 0, 0))
     screen.add_view(title_hbox, lambda w, h, v: ((w-v.required_size().width)//2, 0, title_hbox.required_size().width+1, 1))
 
-    more_label = Label('')
-    legend_hbox = HBox()
-    def set_more_label(clipped):
-        if clipped:
-            more_label.text = '...'
-        else:
-            more_label.text = ''
-
-    legend_hbox.clipping_callback = set_more_label
-    for key, description in LEGEND:
-        key_label = Label(key)
-        key_label.attributes.append(curses.color_pair(COLOR_PAIR_KEY))
-        legend_hbox.add_view(key_label, Padding(2, 0, 0, 0))
-
-        description_label = Label(description)
-        description_label.attributes.append(curses.color_pair(COLOR_PAIR_DESCRIPTION))
-        legend_hbox.add_view(description_label, Padding(0, 0, 0, 0))
-
-    screen.add_view(legend_hbox, lambda w, h, v: (0, h-1, w-more_label.required_size().width, 1))
-    screen.add_view(more_label, lambda  w, h, v: (w-v.required_size().width-1, h-1, v.required_size().width, 1))
+    add_legend(screen, LEGEND)
 
     delegate = TableViewDelegate(change_type_colors)
     def refresh_stage():
         delegate.files = stage.status()
 
+    def refresh_file(i, file):
+        if file.is_renamed():
+            refresh_stage()
+        else:
+            delegate.replace_path(i, stage.status(file.get_relative_path()))
+
+    def apply_changes(changes):
+        if changes is None:
+            return False
+
+        paths = set(changes.paths)
+        if changes.index and stage.has_external_changes():
+            staged_paths = stage.index_changes()
+            if staged_paths is None:
+                changes.everything = True
+            else:
+                paths |= staged_paths
+
+        if changes.everything or len(paths) > WATCHED_PATHS_LIMIT:
+            refresh_stage()
+            return True
+
+        files = stage.status_paths(sorted(paths)) if paths else []
+        # renames pair paths that may not all have been changed, only a full status gets them right
+        if any(file.is_renamed() for file in files) or any(file.is_renamed() and file.get_relative_path() in paths for file in delegate.files):
+            refresh_stage()
+        elif paths:
+            delegate.replace_paths(paths, files)
+
+        # a moved HEAD changes the branch in the title
+        return bool(paths) or changes.refs
+
     refresh_stage()
+    watcher = RepositoryWatcher(stage, worktree=True) if watch else None
 
     list_view = ListView(delegate, delegate)
     screen.add_view(list_view, lambda w, h, v: (0, 1, w, h-2))
@@ -182,8 +387,9 @@ def main(stdscr):
     confirmation_active = False
     confirmation_action = None
 
-    def perform_checkout(file):
-        stage.checkout(file)
+    def perform_checkout(files):
+        stage.checkout_files(files)
+        delegate.clear_marks()
         refresh_stage()
 
     confirmation_background = BackgroundView(curses.color_pair(COLOR_PAIR_CONFIRMATION))
@@ -218,15 +424,62 @@ def main(stdscr):
         screen.remove_view(confirmation_no_label)
         screen.remove_view(confirmation_text_label)
 
+    glob_active = False
+    glob_pattern = ''
+    glob_background = BackgroundView(curses.color_pair(COLOR_PAIR_GLOB))
+    glob_label = Label()
+    glob_label.attributes.append(curses.color_pair(COLOR_PAIR_GLOB))
+    glob_label.attributes.append(curses.A_BOLD)
 
+    def show_glob_input():
+        screen.add_view(glob_background, lambda w, h, v: (0, h-1, w-1, 1))
+        screen.add_view(glob_label, lambda w, h, v: (2, h-1, w-4, 1))
+
+    def hide_glob_input():
+        screen.remove_view(glob_background)
+        screen.remove_view(glob_label)
+
+    error_message = None
+    needs_render = True
+    stdscr.timeout(WATCH_TIMEOUT if watcher else -1)
     while 1:
-        branch_label.text = '['+stage.active_branch_name()+']'
+        if needs_render:
+            branch_label.text = '['+stage.active_branch_name()+']'
+            glob_label.text = 'MARK GLOB=' + glob_pattern
+
+            with profiler.phase('render'):
+                screen.render()
 
-        screen.render()
         key = stdscr.getch()
+        if key == curses.ERR:
+            with profiler.acting('watch'):
+                needs_render = apply_changes(watcher.collect() if watcher else None)
+            continue
+
+        needs_render = True
+        profiler.setAction(profiler.keyAction(key))
+
+        if glob_active:
+            if key == KEY_ESCAPE:
+                glob_active = False
+                hide_glob_input()
+
+            elif key == KEY_ENTER:
+                glob_active = False
+                hide_glob_input()
+                if glob_pattern:
+                    delegate.mark_glob(glob_pattern)
+
+            elif key in [KEY_BACKSPACE, curses.KEY_BACKSPACE]:
+                glob_pattern = glob_pattern[:-1]
+
+            elif 0 <= key < 256:
+                glob_pattern += chr(key)
+
+            continue
 
         if key == KEY_Q:
-            exit(0)
+            break
 
         if confirmation_active:
             if key == curses.KEY_LEFT:
@@ -241,7 +494,11 @@ def main(stdscr):
                 confirmation_active = False
                 hide_confirmation()
                 if yes_selected and confirmation_action is not None:
-                    confirmation_action()
+                    try:
+                        confirmation_action()
+                    except GitCommandError as e:
+                        error_message = e.stderr
+                        break
 
         else:
             if key == curses.KEY_UP:
@@ -251,14 +508,54 @@ def main(stdscr):
                 list_view.select_next()
 
             elif key == KEY_SPACE:
-                file = delegate.get_data(list_view.get_selected_row_index())
-                if file.is_staged():
-                    stage.reset(file)
+                marked_files = delegate.marked_files()
+                if marked_files:
+                    try:
+                        stage.reset_files([file for file in marked_files if file.is_staged()])
+                        stage.add_files([file for file in marked_files if not file.is_staged()])
+                    except GitCommandError as e:
+                        error_message = e.stderr
+                        break
+                    delegate.clear_marks()
+                    refresh_stage()
+                    continue
+
+                selected_index = list_view.get_selected_row_index()
+                if selected_index >= delegate.number_of_rows():
+                    continue
+
+                file = delegate.get_data(selected_index)
+                external_changes = stage.has_external_changes()
+                try:
+                    if file.is_staged():
+                        stage.reset(file)
+                    else:
+                        stage.add(file)
+                except GitCommandError as e:
+                    error_message = e.stderr
+                    break
+
+                if external_changes:
+                    refresh_stage()
                 else:
-                    stage.add(file)
-                refresh_stage()
+                    refresh_file(selected_index, file)
+                list_view.select_next()
+
+            elif key == KEY_M:
+                delegate.toggle_mark(list_view.get_selected_row_index())
                 list_view.select_next()
 
+            elif key == KEY_V:
+                delegate.mark_range(list_view.get_selected_row_index())
+
+            elif key == KEY_G:
+                glob_active = True
+                glob_pattern = ''
+                show_glob_input()
+
+            elif key == KEY_U:
+                delegate.clear_marks()
+
             elif key == KEY_A:
                 all_staged = True
                 for file in stage.status():
@@ -272,7 +569,7 @@ def main(stdscr):
                     stage.add_all()
                 refresh_stage()
 
-            elif key == KEY_I:
+            elif key == KEY_I and delegate.number_of_rows() > 0:
                 file = delegate.get_data(list_view.get_selected_row_index())
                 if file.is_tracked() is not True:
                     stage.ignore(file)
@@ -288,14 +585,220 @@ def main(stdscr):
                 refresh_stage()
 
             elif key == KEY_C:
+                marked_files = [file for file in delegate.marked_files() if file.is_tracked() and not file.is_added()]
+                if marked_files:
+                    confirmation_active = True
+                    yes_selected = False
+                    confirmation_action = lambda : perform_checkout(marked_files)
+                    show_confirmation('Checkout {} marked files?'.format(len(marked_files)))
+                    continue
+
+                if delegate.number_of_rows() == 0:
+                    continue
+
                 file = delegate.get_data(list_view.get_selected_row_index())
-                if file.is_tracked():
+                if file.is_tracked() and not file.is_added():
                     confirmation_active = True
                     yes_selected = False
-                    confirmation_action = lambda : perform_checkout(file)
+                    confirmation_action = lambda : perform_checkout([file])
                     show_confirmation('Checkout selected file?')
 
             elif key == KEY_R:
                 refresh_stage()
 
-curses.wrapper(main)
+    if watcher:
+        watcher.shutdown()
+    return window, error_message
+
+
+def workspace_main(stdscr, directory, jobs, watch=True):
+    window = DamageTrackingWindow(stdscr)
+    init_colors()
+
+    screen = ConstrainedBasedScreen(window)
+    title_background = BackgroundView(curses.color_pair(COLOR_PAIR_TITLE))
+    screen.add_view(title_background, lambda w, h, v: (0, 0, w, 1))
+
+    title = directory
+    try:
+        title = '~/' + str(Path(directory).relative_to(Path.home()))
+    except ValueError:
+        pass
+
+    title_label = Label(title)
+    title_label.attributes.append(curses.color_pair(COLOR_PAIR_TITLE))
+    title_label.attributes.append(curses.A_BOLD)
+    screen.add_view(title_label, lambda w, h, v: ((w-v.required_size().width)//2, 0, v.required_size().width+1, 1))
+
+    status_label = Label()
+    status_label.attributes.append(curses.color_pair(COLOR_PAIR_TITLE))
+    screen.add_view(status_label, lambda w, h, v: (w-v.required_size().width-1, 0, v.required_size().width, 1))
+
+    add_legend(screen, WORKSPACE_LEGEND)
+
+    delegate = WorkspaceDelegate(directory)
+    list_view = ListView(delegate, delegate)
+    screen.add_view(list_view, lambda w, h, v: (0, 1, w, h-2))
+
+    loader = WorkspaceLoader(directory, loadStatus, jobs)
+    error_message = None
+
+    while 1:
+        for _, status in loader.collect():
+            delegate.update(status)
+
+        loading = loader.isLoading()
+        if loading:
+            status_label.text = 'scanning {}/{} repositories'.format(loader.loaded, loader.discovered)
+        else:
+            status_label.text = '{} of {} repositories with changes'.format(len(delegate.repositories), loader.discovered)
+
+        with profiler.phase('render'):
+            screen.render()
+        stdscr.timeout(LOADING_TIMEOUT if loading else -1)
+        key = stdscr.getch()
+        if key != curses.ERR:
+            profiler.setAction(profiler.keyAction(key))
+
+        if key == KEY_Q:
+            loader.shutdown()
+            return window, error_message
+
+        elif key == curses.KEY_UP:
+            list_view.select_previous()
+
+        elif key == curses.KEY_DOWN:
+            list_view.select_next()
+
+        elif key == KEY_ENTER and delegate.number_of_rows() > 0:
+            status = delegate.get_data(list_view.get_selected_row_index())
+            _, repository_error = main(stdscr, Stage(status.repository), watch)
+            if repository_error:
+                error_message = repository_error
+            init_colors()
+            window.invalidate()
+            loader.reload(status.repository)
+
+        elif key == KEY_R:
+            loader.shutdown()
+            delegate.clear()
+            loader = WorkspaceLoader(directory, loadStatus, jobs)
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, got {}'.format(value))
+    return number
+
+
+def parse_arguments():
+    argparser = argparse.ArgumentParser(
+        prog='stage',
+        description='Gives you an interactive overview of your working tree and index'
+    )
+    argparser.add_argument(
+        'PATH', nargs="?",
+        help='The path to the git repository that shall be used. If no path is provided the current working directory will be used.'
+    )
+    argparser.add_argument(
+        '-w',
+        '--workspace',
+        help="Treats PATH as a workspace and lists all git repositories below it that have uncommitted changes",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '-j',
+        '--jobs',
+        help="How many repositories are scanned at the same time in workspace mode",
+        type=positive_int,
+        default=WORKSPACE_JOBS
+    )
+    argparser.add_argument(
+        '-s',
+        '--stats',
+        help="Prints how many git processes were spawned and screen cells were redrawn during the session on exit",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--no-watch',
+        help="Does not watch the repository for changes made outside the tool, which then only show up after [R]",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--json',
+        help="Skips the interactive UI and streams all changed files as JSON, one object per line, as git reports them",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--profile',
+        help="Records every git invocation and the time spent reading the status and rendering as a trace file and prints a summary on exit",
+        action="store_true"
+    )
+    argparser.add_argument(
+        '--trace',
+        help="Where the trace of --profile is written to. Defaults to a file in the temporary directory."
+    )
+    return argparser.parse_args()
+
+
+def file_records(directories, workspace):
+    for directory in directories:
+        try:
+            for file in Stage(directory).stream_status():
+                result = file.to_dict()
+                if workspace:
+                    result['repository'] = directory
+                yield result
+        except (GitCommandError, InvalidGitRepositoryError) as e:
+            print('{}: {}'.format(directory, e), file=sys.stderr)
+
+
+def print_process_statistics(stage):
+    spawned = stage.spawnedProcesses()
+    print('git processes spawned: {}'.format(sum(spawned.values())), file=sys.stderr)
+    for command, count in spawned.most_common():
+        print('  {:<16} {:>6}'.format(command, count), file=sys.stderr)
+
+
+def print_render_statistics(window):
+    average = window.redrawnCells / window.frames if window.frames else 0
+    print('frames rendered: {}, cells redrawn: {} ({:.1f} per frame)'.format(window.frames, window.redrawnCells, average), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    args = parse_arguments()
+
+    if args.profile:
+        profiler.enable()
+
+    repository_directory = os.path.abspath(args.PATH) if args.PATH else os.getcwd()
+
+    if args.json:
+        directories = discoverRepositories(repository_directory) if args.workspace else [repository_directory]
+        ndjson.write(file_records(directories, args.workspace))
+        if args.profile:
+            profiler.finish(args.trace or profiler.defaultTracePath('stage'))
+        exit(0)
+
+    if args.workspace:
+        window, error_message = curses.wrapper(workspace_main, repository_directory, args.jobs, not args.no_watch)
+        if error_message:
+            print(error_message, file=sys.stderr)
+        if args.stats:
+            print_render_statistics(window)
+        if args.profile:
+            profiler.finish(args.trace or profiler.defaultTracePath('stage'))
+        exit(0)
+
+    stage = Stage(repository_directory)
+    window, error_message = curses.wrapper(main, stage, not args.no_watch)
+    if error_message:
+        print(error_message, file=sys.stderr)
+
+    if args.stats:
+        print_process_statistics(stage)
+        print_render_statistics(window)
+
+    if args.profile:
+        profiler.finish(args.trace or profiler.defaultTracePath('stage'))
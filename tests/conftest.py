@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ENVIRONMENT = {
+    'GIT_AUTHOR_NAME': 'Test',
+    'GIT_AUTHOR_EMAIL': 'test@example.com',
+    'GIT_COMMITTER_NAME': 'Test',
+    'GIT_COMMITTER_EMAIL': 'test@example.com',
+    'GIT_CONFIG_NOSYSTEM': '1',
+    'HOME': os.devnull,
+}
+
+
+def git(directory, *arguments, input=None):
+    result = subprocess.run(['git'] + list(arguments), cwd=directory, input=input, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=dict(os.environ, **ENVIRONMENT))
+    return result.stdout.decode().strip()
+
+
+def collect(collector, isBusy, timeout=30):
+    # background work is collected the way the UI loops do, until it is done or takes too long
+    results = []
+    deadline = time.monotonic() + timeout
+    while isBusy() and time.monotonic() < deadline:
+        results += collector.collect()
+        time.sleep(0.01)
+
+    return results + collector.collect()
+
+
+@pytest.fixture
+def repository(tmp_path):
+    directory = str(tmp_path / 'repository')
+    git(str(tmp_path), 'init', '-q', '-b', 'master', directory)
+    git(directory, 'config', 'user.name', 'Test')
+    git(directory, 'config', 'user.email', 'test@example.com')
+    return directory
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from conftest import git
+from utils.git import Branch, BranchRecord, Repository
+
+EPOCH = 1600000000
+DAY = 24 * 60 * 60
+
+
+def skewedHistory(directory, seed, commits=300, branches=25):
+    # random merges, with every twentieth commit dated a day early
+    rng = random.Random(seed)
+    chunks = []
+    for mark in range(1, commits + 1):
+        date = EPOCH + mark * 60 - (DAY if rng.random() < 0.05 else 0)
+        chunks.append('commit refs/heads/master\nmark :{}\ncommitter Test <test@example.com> {} +0000\ndata 2\n{}\n'.format(mark, date, mark % 10))
+        if mark > 1:
+            chunks.append('from :{}\n'.format(rng.randint(max(1, mark - 20), mark - 1)))
+        if mark > 2 and rng.random() < 0.2:
+            chunks.append('merge :{}\n'.format(rng.randint(max(1, mark - 40), mark - 1)))
+        chunks.append('\n')
+
+    for i in range(branches):
+        chunks.append('reset refs/heads/branch{}\nfrom :{}\n\n'.format(i, rng.randint(1, commits)))
+
+    git(directory, 'fast-import', '--quiet', input=''.join(chunks).encode())
+    return [ git(directory, 'rev-parse', 'branch{}'.format(i)) for i in range(branches) ]
+
+
+def expected(directory, commit, upstreamCommit):
+    behind, ahead = git(directory, 'rev-list', '--left-right', '--count', '{}...{}'.format(upstreamCommit, commit)).split()
+    return (int(ahead), int(behind))
+
+
+def pairs(tips, count, seed):
+    rng = random.Random(seed)
+    return [ (rng.choice(tips), rng.choice(tips)) for _ in range(count) ]
+
+
+def assertWithinLimit(counts, truth, limit):
+    if len(counts) == 2:
+        assert counts == truth
+        return
+
+    # one count stopped past the limit, the other one is a lower bound
+    assert counts[2] == limit
+    assert any(count == limit + 1 and actual > limit for count, actual in zip(counts[:2], truth))
+    assert all(count <= min(actual, limit + 1) for count, actual in zip(counts[:2], truth))
+
+
+@pytest.mark.parametrize('limit', [ 7, 40 ])
+def test_skewed_dates_without_commit_graph(repository, limit):
+    tips = skewedHistory(repository, limit)
+    repo = Repository(repository)
+    repo.divergenceLimit = limit
+    assert repo.commitGraph() is None
+
+    for commit, upstreamCommit in pairs(tips, 150, limit):
+        truth = expected(repository, commit, upstreamCommit)
+        assertWithinLimit(repo.countDivergence(commit, upstreamCommit), truth, limit)
+
+
+@pytest.mark.parametrize('limit', [ 7, 40 ])
+def test_skewed_dates_with_commit_graph(repository, limit):
+    tips = skewedHistory(repository, limit)
+    git(repository, 'commit-graph', 'write', '--reachable', '--split')
+    repo = Repository(repository)
+    repo.divergenceLimit = limit
+    assert repo.commitGraph() is not None
+
+    limited = 0
+    for commit, upstreamCommit in pairs(tips, 150, limit):
+        truth = expected(repository, commit, upstreamCommit)
+        counts = repo.countDivergence(commit, upstreamCommit)
+        assertWithinLimit(counts, truth, limit)
+        limited += len(counts) == 3
+
+    assert limited > 0
+
+
+def test_exact_counts_are_not_limited(repository):
+    tips = skewedHistory(repository, 1)
+    git(repository, 'commit-graph', 'write', '--reachable', '--split')
+    repo = Repository(repository)
+    repo.divergenceLimit = 3
+
+    for commit, upstreamCommit in pairs(tips, 50, 1):
+        assert repo.countDivergence(commit, upstreamCommit, exact=True) == expected(repository, commit, upstreamCommit)
+
+
+@pytest.mark.parametrize('divergence, diff', [
+    ((3, 4), '↑·3↓·4'),
+    ((0, 4), '↓·4'),
+    ((3, 4, 999), '↑·3↓·4'),
+    ((3, 1000, 999), '↑·3+↓·999+'),
+    ((0, 1000, 999), '↑·0+↓·999+'),
+    ((1000, 5, 999), '↑·999+↓·5+'),
+])
+def test_lower_bounds_are_marked(divergence, diff):
+    record = BranchRecord('refs/heads/topic', 'topic', None, None, 'refs/remotes/origin/topic', 'origin/topic', None, False)
+    branch = Branch(None, record)
+    branch.setDivergence(divergence)
+    assert branch.diff == diff
@@ -0,0 +1,68 @@
+import pytest
+
+from conftest import collect, git
+from utils.fetch import RemoteFetcher
+from utils.git import Repository
+
+
+@pytest.fixture
+def remotes(tmp_path, repository):
+    # two local bare repositories serve as remotes, another clone pushes to the first one
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    for name in [ 'origin', 'mirror' ]:
+        bare = str(tmp_path / (name + '.git'))
+        git(str(tmp_path), 'init', '-q', '--bare', bare)
+        git(repository, 'remote', 'add', name, bare)
+        git(repository, 'push', '-q', name, 'master', 'master:topic')
+        git(repository, 'fetch', '-q', name)
+
+    other = str(tmp_path / 'other')
+    git(str(tmp_path), 'clone', '-q', str(tmp_path / 'origin.git'), other)
+    return other
+
+
+def push(clone, *refspecs):
+    git(clone, 'commit', '-q', '--allow-empty', '-m', 'change')
+    git(clone, 'push', '-q', 'origin', *refspecs)
+
+
+def test_fetch_remote_reports_moved_refs(repository, remotes):
+    push(remotes, 'HEAD:topic', 'HEAD:added')
+
+    moved = Repository(repository).fetchRemote('origin')
+    assert moved == { 'refs/remotes/origin/topic', 'refs/remotes/origin/added' }
+    assert git(repository, 'rev-parse', 'origin/topic') == git(remotes, 'rev-parse', 'HEAD')
+
+
+def test_fetch_remote_without_changes(repository, remotes):
+    assert Repository(repository).fetchRemote('origin') == set()
+
+
+def test_fetch_remote_prunes_nothing(repository, remotes):
+    # refs deleted on the remote are kept by a plain fetch, so they did not move
+    git(remotes, 'push', '-q', 'origin', ':topic')
+    assert Repository(repository).fetchRemote('origin') == set()
+
+
+def test_fetcher_fetches_all_remotes(repository, remotes):
+    push(remotes, 'HEAD:topic')
+    fetcher = RemoteFetcher(Repository(repository))
+    fetcher.start()
+    assert fetcher.isRunning()
+    assert fetcher.status().startswith('fetching ')
+
+    completed = dict(collect(fetcher, fetcher.isRunning))
+    assert completed == { 'origin': { 'refs/remotes/origin/topic' }, 'mirror': set() }
+    assert fetcher.status() == ''
+    fetcher.shutdown()
+
+
+def test_fetcher_reports_unreachable_remote(tmp_path, repository, remotes):
+    git(repository, 'remote', 'add', 'gone', str(tmp_path / 'missing.git'))
+    fetcher = RemoteFetcher(Repository(repository))
+    fetcher.start()
+
+    completed = dict(collect(fetcher, fetcher.isRunning))
+    assert set(completed) == { 'origin', 'mirror' }
+    assert fetcher.status() == 'fetch failed: origin {0} mirror {0} gone {1}'.format(RemoteFetcher.DONE, RemoteFetcher.FAILED)
+    fetcher.shutdown()
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from conftest import git
+from utils.git import Repository
+from utils.refs import RefReader
+
+PATTERNS = [ 'refs/heads', 'refs/remotes' ]
+
+
+@pytest.fixture
+def refs(tmp_path, repository):
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    git(repository, 'tag', '-a', '-m', 'annotated', 'v1')
+    git(repository, 'branch', 'feature')
+    git(repository, 'branch', 'nested/topic')
+
+    origin = str(tmp_path / 'origin.git')
+    git(str(tmp_path), 'clone', '-q', '--bare', repository, origin)
+    for name in [ 'origin', 'mirror' ]:
+        git(repository, 'remote', 'add', name, origin)
+        git(repository, 'fetch', '-q', name)
+    git(repository, 'remote', 'set-head', 'origin', 'master')
+
+    # everything so far is packed, along with the peeled tag, the refs changed from here on are loose
+    git(repository, 'pack-refs', '--all')
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'second')
+    git(repository, 'update-ref', 'refs/remotes/origin/feature', 'HEAD')
+    git(repository, 'branch', 'loose')
+
+    git(repository, 'branch', '-q', '--set-upstream-to=origin/feature', 'feature')
+    git(repository, 'branch', '-q', '--set-upstream-to=master', 'nested/topic')
+    git(repository, 'branch', '-q', '--set-upstream-to=mirror/master', 'loose')
+    git(repository, 'checkout', '-q', 'feature')
+    return repository
+
+
+def forEachRef(repository):
+    output = git(repository, 'for-each-ref', '--format=%(refname) %(objectname) %(symref)', *PATTERNS)
+    return { refname: objectname for refname, objectname, *symref in (line.split(' ') for line in output.splitlines()) if not any(symref) }
+
+
+def test_refs_match_git(refs):
+    gitDir = os.path.join(refs, '.git')
+    reader = RefReader(gitDir, gitDir)
+    assert reader.refs() == forEachRef(refs)
+    assert reader.head() == 'refs/heads/feature'
+
+    # the cases the fixture is meant to set up: a peeled tag, a packed ref overridden by a loose one and a symbolic ref
+    with open(os.path.join(gitDir, 'packed-refs')) as file:
+        packed = file.read()
+    assert '\n^' in packed and ' refs/heads/master\n' in packed
+    assert os.path.exists(os.path.join(gitDir, 'refs', 'heads', 'master'))
+    assert git(refs, 'symbolic-ref', 'refs/remotes/origin/HEAD') == 'refs/remotes/origin/master'
+
+
+def test_branch_records_match_git(refs):
+    repository = Repository(refs)
+    read = [ record.toDict() for record in repository.branchRecords(PATTERNS) ]
+    # counting divergence makes the records be queried from git
+    queried = [ dict(record.toDict(), ahead=None, behind=None) for record in repository.branchRecords(PATTERNS, withDivergence=True) ]
+
+    assert read == queried
+    assert { record['name']: record['upstream'] for record in read if not record['remote'] } == {
+        'feature': 'origin/feature',
+        'loose': 'mirror/master',
+        'master': None,
+        'nested/topic': 'master',
+    }
+    assert [ (record['remote'], record['name']) for record in read if record['remote'] ] == [
+        ('mirror', 'feature'), ('mirror', 'master'), ('mirror', 'nested/topic'),
+        ('origin', 'feature'), ('origin', 'master'), ('origin', 'nested/topic'),
+    ]
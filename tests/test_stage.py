@@ -0,0 +1,112 @@
+import os
+import subprocess
+
+import pytest
+from git import GitCommandError
+
+from conftest import git
+from utils.git import File, Stage
+
+
+def write(repository, path, content='content\n'):
+    with open(os.path.join(repository, path), 'w') as file:
+        file.write(content)
+
+
+def changes(stage):
+    return [ (file.get_relative_path(), file.is_staged(), file.get_change_type()) for file in stage.status() ]
+
+
+def test_files_are_unstaged_in_a_repository_without_commits(repository):
+    write(repository, 'a')
+    write(repository, 'b c')
+    stage = Stage(repository)
+    stage.add_files(stage.status())
+    assert changes(stage) == [ ('a', True, 'A'), ('b c', True, 'A') ]
+
+    stage.reset([ file for file in stage.status() if file.get_relative_path() == 'b c' ][0])
+    assert changes(stage) == [ ('a', True, 'A'), ('b c', False, '?') ]
+
+    stage.reset_all()
+    assert changes(stage) == [ ('a', False, '?'), ('b c', False, '?') ]
+
+
+def test_checkout_leaves_files_only_added_to_the_index_alone(repository):
+    write(repository, 'staged')
+    write(repository, 'unstaged')
+    git(repository, 'add', '.')
+    git(repository, 'commit', '-q', '-m', 'initial')
+    write(repository, 'staged', 'changed\n')
+    write(repository, 'unstaged', 'changed\n')
+    write(repository, 'added')
+    git(repository, 'add', 'staged', 'added')
+
+    stage = Stage(repository)
+    stage.checkout_files(stage.status())
+    assert changes(stage) == [ ('added', True, 'A') ]
+
+
+def test_failing_checkout_leaves_the_index_unchanged(repository):
+    write(repository, 'staged')
+    git(repository, 'add', '.')
+    git(repository, 'commit', '-q', '-m', 'initial')
+    write(repository, 'staged', 'changed\n')
+    git(repository, 'add', 'staged')
+
+    stage = Stage(repository)
+    with pytest.raises(GitCommandError):
+        stage.checkout_files(stage.status() + [ File('missing', True, True, False, 'M') ])
+    assert changes(stage) == [ ('staged', True, 'M') ]
+
+
+def test_opening_a_repository_runs_no_git(repository):
+    assert sum(Stage(repository).spawnedProcesses().values()) == 0
+
+
+def entries(stage):
+    return [ (file.get_relative_path(), file.is_tracked(), file.is_staged(), file.is_renamed(), file.get_change_type()) for file in stage.status() ]
+
+
+def test_status_lists_renamed_unmerged_and_untracked_files(repository):
+    write(repository, 'old name')
+    write(repository, 'conflict', 'base\n')
+    write(repository, 'kept')
+    git(repository, 'add', '.')
+    git(repository, 'commit', '-q', '-m', 'initial')
+    git(repository, 'checkout', '-q', '-b', 'other')
+    write(repository, 'conflict', 'theirs\n')
+    git(repository, 'commit', '-q', '-a', '-m', 'theirs')
+    git(repository, 'checkout', '-q', 'master')
+    write(repository, 'conflict', 'ours\n')
+    git(repository, 'commit', '-q', '-a', '-m', 'ours')
+    with pytest.raises(subprocess.CalledProcessError):
+        git(repository, 'merge', 'other')
+
+    git(repository, 'mv', 'old name', 'new name')
+    write(repository, 'new name', 'renamed and changed\n')
+    write(repository, 'kept', 'changed\n')
+    os.mkdir(os.path.join(repository, 'new dir'))
+    write(repository, 'new dir/untracked file')
+
+    assert entries(Stage(repository)) == [
+        ('conflict', True, False, False, 'M'),
+        ('kept', True, False, False, 'M'),
+        ('new dir/untracked file', False, False, False, '?'),
+        ('new name', True, True, True, 'R'),
+        ('new name', True, False, False, 'M'),
+    ]
+
+
+def test_status_of_a_repository_without_commits(repository):
+    write(repository, 'staged file')
+    write(repository, 'untracked file')
+    git(repository, 'add', 'staged file')
+    write(repository, 'staged file', 'changed\n')
+
+    stage = Stage(repository)
+    assert entries(stage) == [
+        ('staged file', True, True, False, 'A'),
+        ('staged file', True, False, False, 'M'),
+        ('untracked file', False, False, False, '?'),
+    ]
+    assert stage.index_changes() is None
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from conftest import git
+from utils import watcher
+from utils.watcher import PollingBackend
+
+
+class Clock:
+
+    def __init__(self):
+        super().__init__()
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(watcher.time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def backend(repository, clock):
+    os.mkdir(os.path.join(repository, 'src'))
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    gitDir = os.path.join(repository, '.git')
+    return PollingBackend(gitDir, gitDir, repository, set())
+
+
+def poll(backend, clock, seconds):
+    clock.now += seconds
+    return sorted(backend.poll(0), key=str)
+
+
+def touch(repository, name):
+    open(os.path.join(repository, 'src', name), 'w').close()
+
+
+def test_refs_are_polled_every_interval(repository, clock, backend):
+    git(repository, 'branch', 'topic')
+    assert poll(backend, clock, PollingBackend.INTERVAL / 2) == []
+    assert poll(backend, clock, PollingBackend.INTERVAL / 2) == [ ('refs', None) ]
+    assert poll(backend, clock, PollingBackend.INTERVAL) == []
+
+
+def test_worktree_is_polled_less_often(repository, clock, backend):
+    touch(repository, 'file')
+    assert poll(backend, clock, PollingBackend.INTERVAL) == []
+    assert poll(backend, clock, PollingBackend.WORKTREE_INTERVAL - PollingBackend.INTERVAL) == [ ('path', 'src'), ('path', 'src/file') ]
+
+
+def test_worktree_polling_backs_off_until_something_changes(repository, clock, backend):
+    interval = PollingBackend.WORKTREE_INTERVAL
+    assert poll(backend, clock, interval) == []
+
+    # nothing changed, so the next walk waits twice as long
+    touch(repository, 'file')
+    assert poll(backend, clock, interval) == []
+    assert poll(backend, clock, interval) == [ ('path', 'src'), ('path', 'src/file') ]
+
+    # the change brings the interval back down
+    touch(repository, 'other')
+    assert poll(backend, clock, interval) == [ ('path', 'src'), ('path', 'src/other') ]
+
+    for _ in range(10):
+        poll(backend, clock, PollingBackend.MAX_WORKTREE_INTERVAL)
+    touch(repository, 'late')
+    assert poll(backend, clock, PollingBackend.MAX_WORKTREE_INTERVAL) == [ ('path', 'src'), ('path', 'src/late') ]
+
+
+def test_changes_in_git_walk_the_worktree_right_away(repository, clock, backend):
+    touch(repository, 'file')
+    git(repository, 'add', 'src/file')
+    assert poll(backend, clock, PollingBackend.INTERVAL) == [ ('index', None), ('path', 'src'), ('path', 'src/file') ]
+
+
+def test_files_edited_in_place_are_noticed(repository, clock, backend):
+    touch(repository, 'file')
+    poll(backend, clock, PollingBackend.WORKTREE_INTERVAL)
+
+    with open(os.path.join(repository, 'src', 'file'), 'w') as file:
+        file.write('edited\n')
+    assert poll(backend, clock, PollingBackend.WORKTREE_INTERVAL) == [ ('path', 'src/file') ]
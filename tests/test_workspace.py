@@ -0,0 +1,48 @@
+import os
+
+from conftest import collect, git
+from utils.workspace import WorkspaceLoader, loadBranches
+
+
+def test_reloads_are_not_counted_again(tmp_path, repository):
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    other = str(tmp_path / 'other')
+    git(str(tmp_path), 'clone', '-q', repository, other)
+
+    loader = WorkspaceLoader(str(tmp_path), loadBranches, workers=1)
+    try:
+        assert sorted(repository for repository, _ in collect(loader, loader.isLoading)) == [ other, repository ]
+
+        for _ in range(3):
+            loader.reload(repository)
+            assert [ repository for repository, _ in collect(loader, loader.isLoading) ] == [ repository ]
+
+        assert loader.loaded == loader.discovered == 2
+    finally:
+        loader.shutdown()
+
+
+def test_repositories_loading_again_are_no_longer_failed(tmp_path, repository):
+    git(repository, 'commit', '-q', '--allow-empty', '-m', 'initial')
+    head = os.path.join(repository, '.git', 'HEAD')
+    with open(head) as file:
+        content = file.read()
+
+    os.rename(head, head + '.moved')
+    loader = WorkspaceLoader(str(tmp_path), loadBranches, workers=1)
+    try:
+        collect(loader, loader.isLoading)
+        assert loader.failed == [ repository ]
+
+        loader.reload(repository)
+        collect(loader, loader.isLoading)
+        assert loader.failed == [ repository ]
+
+        with open(head, 'w') as file:
+            file.write(content)
+        loader.reload(repository)
+        collect(loader, loader.isLoading)
+        assert loader.failed == []
+        assert loader.loaded == loader.discovered == 1
+    finally:
+        loader.shutdown()
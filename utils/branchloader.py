@@ -0,0 +1,46 @@
+from threading import Lock, Thread
+
+
+class BranchLoader:
+
+    def __init__(self, repository, local=True, remotes=False):
+        super().__init__()
+        self.__arrived = []
+        self.__lock = Lock()
+        self.__stopped = False
+        self.__error = None
+        self.__loading = True
+
+        self.__thread = Thread(target=self.__load, args=(repository, local, remotes), daemon=True)
+        self.__thread.start()
+
+    def __load(self, repository, local, remotes):
+        branches = repository.iterBranches(local, remotes)
+        try:
+            for branch in branches:
+                if self.__stopped:
+                    break
+
+                with self.__lock:
+                    self.__arrived.append(branch)
+        except Exception as e:
+            self.__error = e
+        finally:
+            branches.close()
+            self.__loading = False
+
+    def collect(self):
+        with self.__lock:
+            arrived, self.__arrived = self.__arrived, []
+
+        if self.__error:
+            error, self.__error = self.__error, None
+            raise error
+
+        return arrived
+
+    def isLoading(self):
+        return self.__loading
+
+    def shutdown(self):
+        self.__stopped = True
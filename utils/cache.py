@@ -0,0 +1,75 @@
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+
+class DivergenceCache:
+
+    FILENAME = 'git-toolbox-divergence.json'
+    MAX_ENTRIES = 10000
+
+    def __init__(self, path, maxEntries=MAX_ENTRIES):
+        super().__init__()
+        self.__path = path
+        self.__maxEntries = maxEntries
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+        self.__dirty = False
+        # read on first use, as most runs of stage never ask for it
+        self.__loaded = False
+
+    def __load(self):
+        if self.__loaded:
+            return
+
+        self.__loaded = True
+        try:
+            with open(self.__path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        for key, counts in entries.items():
+            self.__entries[key] = tuple(counts)
+
+    def __key(self, commit, upstreamCommit):
+        return '{}..{}'.format(commit, upstreamCommit)
+
+    def get(self, commit, upstreamCommit):
+        key = self.__key(commit, upstreamCommit)
+        with self.__lock:
+            self.__load()
+            counts = self.__entries.get(key)
+            if counts is not None:
+                self.__entries.move_to_end(key)
+
+            return counts
+
+    def put(self, commit, upstreamCommit, counts):
+        key = self.__key(commit, upstreamCommit)
+        with self.__lock:
+            self.__load()
+            self.__entries[key] = tuple(counts)
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__maxEntries:
+                self.__entries.popitem(last=False)
+
+            self.__dirty = True
+
+    def save(self):
+        with self.__lock:
+            if not self.__dirty:
+                return
+
+            entries = OrderedDict(self.__entries)
+            self.__dirty = False
+
+        temporaryPath = self.__path + '.tmp'
+        try:
+            with open(temporaryPath, 'w') as file:
+                json.dump(entries, file)
+            os.replace(temporaryPath, self.__path)
+        except OSError:
+            pass
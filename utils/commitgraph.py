@@ -0,0 +1,171 @@
+import os
+import struct
+
+HEADER = struct.Struct('>4sBBBB')
+CHUNK = struct.Struct('>4sQ')
+WORD = struct.Struct('>I')
+# the first parent, the second parent or extra edges, the generation along with the upper bits of the commit time
+PARENTS = struct.Struct('>III')
+SIGNATURE = b'CGPH'
+HASH_LENGTHS = { 1: 20, 2: 32 }
+NO_PARENT = 0x70000000
+EXTRA_EDGES = 0x80000000
+LAST_EDGE = 0x80000000
+# generations of graphs written by git before 2.19, and those too deep to be stored
+GENERATION_ZERO = 0
+GENERATION_MAX = 0x3FFFFFFF
+
+
+def paths(objectsDirectory):
+    info = os.path.join(objectsDirectory, 'info')
+    return os.path.join(info, 'commit-graph'), os.path.join(info, 'commit-graphs', 'commit-graph-chain')
+
+
+def signature(objectsDirectory):
+    result = []
+    for path in paths(objectsDirectory):
+        try:
+            stat = os.stat(path)
+            result.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+        except OSError:
+            result.append(None)
+
+    return tuple(result)
+
+
+def load(objectsDirectory):
+    # like git, a single graph file is preferred over a chain of split ones
+    single, chain = paths(objectsDirectory)
+    if os.path.exists(single):
+        layerPaths = [ single ]
+    else:
+        try:
+            with open(chain) as file:
+                hashes = [ line.strip() for line in file if line.strip() ]
+        except OSError:
+            return None
+
+        layerPaths = [ os.path.join(os.path.dirname(chain), 'graph-{}.graph'.format(hash)) for hash in hashes ]
+
+    layers = []
+    try:
+        for path in layerPaths:
+            layer = CommitGraphLayer(path, sum(layer.count for layer in layers))
+            layers.append(layer)
+    except (OSError, ValueError, struct.error):
+        # a graph written meanwhile, or in a version unknown here, is as good as none
+        return None
+
+    return CommitGraph(layers) if layers else None
+
+
+class CommitGraphLayer:
+
+    def __init__(self, path, offset):
+        super().__init__()
+        with open(path, 'rb') as file:
+            self.__data = file.read()
+
+        magic, version, hashVersion, chunkCount, _ = HEADER.unpack_from(self.__data)
+        if magic != SIGNATURE or version != 1 or hashVersion not in HASH_LENGTHS:
+            raise ValueError('{} is no commit-graph of a known version'.format(path))
+
+        chunks = {}
+        for i in range(chunkCount):
+            identifier, start = CHUNK.unpack_from(self.__data, HEADER.size + i * CHUNK.size)
+            chunks[identifier] = start
+
+        if not all(identifier in chunks for identifier in [ b'OIDF', b'OIDL', b'CDAT' ]):
+            raise ValueError('{} lacks a required chunk'.format(path))
+
+        self.__hashLength = HASH_LENGTHS[hashVersion]
+        self.__fanout = chunks[b'OIDF']
+        self.__oids = chunks[b'OIDL']
+        self.__commits = chunks[b'CDAT']
+        self.__edges = chunks.get(b'EDGE')
+        # positions are counted across the whole chain, starting with the layer at its base
+        self.offset = offset
+        self.count = WORD.unpack_from(self.__data, self.__fanout + 255 * WORD.size)[0]
+
+    def position(self, oid):
+        data, hashLength = self.__data, self.__hashLength
+        low = WORD.unpack_from(data, self.__fanout + (oid[0] - 1) * WORD.size)[0] if oid[0] else 0
+        high = WORD.unpack_from(data, self.__fanout + oid[0] * WORD.size)[0]
+        while low < high:
+            middle = (low + high) // 2
+            start = self.__oids + middle * hashLength
+            candidate = data[start:start + hashLength]
+            if candidate < oid:
+                low = middle + 1
+            elif candidate > oid:
+                high = middle
+            else:
+                return self.offset + middle
+
+        return None
+
+    def generation(self, position):
+        start = self.__commits + (position - self.offset) * (self.__hashLength + 16) + self.__hashLength
+        return PARENTS.unpack_from(self.__data, start)[2] >> 2
+
+    def parents(self, position):
+        start = self.__commits + (position - self.offset) * (self.__hashLength + 16) + self.__hashLength
+        first, second, _ = PARENTS.unpack_from(self.__data, start)
+        if first == NO_PARENT:
+            return []
+
+        if second == NO_PARENT:
+            return [ first ]
+
+        if not second & EXTRA_EDGES:
+            return [ first, second ]
+
+        # octopus merges list all but their first parent in the extra edges chunk
+        result = [ first ]
+        edge = self.__edges + (second & ~EXTRA_EDGES) * WORD.size
+        while True:
+            value = WORD.unpack_from(self.__data, edge)[0]
+            result.append(value & ~LAST_EDGE)
+            if value & LAST_EDGE:
+                return result
+
+            edge += WORD.size
+
+
+class CommitGraph:
+
+    def __init__(self, layers):
+        super().__init__()
+        self.__layers = layers
+
+    def position(self, hexsha):
+        try:
+            oid = bytes.fromhex(hexsha)
+        except (TypeError, ValueError):
+            return None
+
+        for layer in self.__layers:
+            position = layer.position(oid)
+            if position is not None:
+                return position
+
+        return None
+
+    def covers(self, hexsha):
+        position = self.position(hexsha)
+        # without proper generation numbers a walk cannot tell when it is done
+        return position is not None and GENERATION_ZERO < self.generation(position) < GENERATION_MAX
+
+    def __layer(self, position):
+        for layer in reversed(self.__layers):
+            if position >= layer.offset:
+                return layer
+
+    def generation(self, position):
+        return self.__layer(position).generation(position)
+
+    def parents(self, position):
+        return self.__layer(position).parents(position)
+
+    def __len__(self):
+        return sum(layer.count for layer in self.__layers)
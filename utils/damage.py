@@ -0,0 +1,135 @@
+import curses
+
+BLANK = (' ', 0)
+
+
+class DamageTrackingWindow:
+
+    def __init__(self, window):
+        super().__init__()
+        self.__window = window
+        self.__front = {}
+        self.__back = {}
+        self.__size = None
+        self.__y = 0
+        self.__x = 0
+        self.__attributes = 0
+        self.frames = 0
+        self.redrawnCells = 0
+        self.lastFrameRedraws = 0
+
+    def __getattr__(self, name):
+        return getattr(self.__window, name)
+
+    def __put(self, y, x, text, attributes):
+        attributes |= self.__attributes
+        for character in text:
+            if character == '\n':
+                y, x = y + 1, 0
+                continue
+
+            self.__back[(y, x)] = (character, attributes)
+            x += 1
+
+        self.__y, self.__x = y, x
+
+    def __split(self, args, counted=False):
+        if len(args) >= 3 + counted:
+            y, x, args = args[0], args[1], args[2:]
+        else:
+            y, x = self.__y, self.__x
+
+        text = args[0]
+        limit = args[1] if counted else None
+        rest = args[2:] if counted else args[1:]
+        attributes = rest[0] if rest else 0
+
+        if isinstance(text, int):
+            attributes |= text & ~curses.A_CHARTEXT
+            text = chr(text & curses.A_CHARTEXT)
+
+        if limit is not None and limit >= 0:
+            text = text[:limit]
+
+        return y, x, text, attributes
+
+    def addstr(self, *args):
+        self.__put(*self.__split(args))
+
+    def addnstr(self, *args):
+        self.__put(*self.__split(args, counted=True))
+
+    def addch(self, *args):
+        self.__put(*self.__split(args))
+
+    def insstr(self, *args):
+        self.__put(*self.__split(args))
+
+    def move(self, y, x):
+        self.__y, self.__x = y, x
+
+    def getyx(self):
+        return (self.__y, self.__x)
+
+    def attron(self, attributes):
+        self.__attributes |= attributes
+
+    def attroff(self, attributes):
+        self.__attributes &= ~attributes
+
+    def attrset(self, attributes):
+        self.__attributes = attributes
+
+    def erase(self):
+        self.__back = {}
+
+    def clear(self):
+        self.__back = {}
+
+    def clrtoeol(self):
+        for position in [ position for position in self.__back if position[0] == self.__y and position[1] >= self.__x ]:
+            del self.__back[position]
+
+    def clrtobot(self):
+        for position in [ position for position in self.__back if position >= (self.__y, self.__x) ]:
+            del self.__back[position]
+
+    def invalidate(self):
+        self.__size = None
+
+    def noutrefresh(self):
+        self.__flush()
+        self.__window.noutrefresh()
+
+    def refresh(self):
+        self.__flush()
+        self.__window.refresh()
+
+    def __flush(self):
+        height, width = self.__window.getmaxyx()
+        if self.__size != (height, width):
+            self.__size = (height, width)
+            self.__front = {}
+            self.__window.erase()
+
+        redraws = 0
+        for position in set(self.__front) | set(self.__back):
+            cell = self.__back.get(position, BLANK)
+            if self.__front.get(position, BLANK) == cell:
+                continue
+
+            y, x = position
+            if 0 <= y < height and 0 <= x < width:
+                try:
+                    self.__window.addstr(y, x, cell[0], cell[1])
+                except curses.error:
+                    # writing the bottom right cell fails after the character was placed
+                    pass
+                redraws += 1
+
+        self.__front = self.__back
+        self.__back = dict(self.__front)
+
+        self.frames += 1
+        self.lastFrameRedraws = redraws
+        self.redrawnCells += redraws
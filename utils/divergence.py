@@ -0,0 +1,85 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from git import GitCommandError
+
+from utils import profiler
+
+
+class DivergenceLoader:
+
+    def __init__(self, repository, workers=4):
+        super().__init__()
+        self.__repository = repository
+        self.__executor = ThreadPoolExecutor(max_workers=workers)
+        self.__futures = {}
+        self.__requested = set()
+        self.__exact = set()
+
+    def reset(self):
+        for future in self.__futures.values():
+            future.cancel()
+
+        self.__futures = {}
+        self.__requested = set()
+        self.__exact = set()
+
+    def __key(self, branch):
+        return (branch, branch.commit, branch.upstreamCommit)
+
+    def request(self, branches):
+        # tips of upstreams are unknown while branches are still being read
+        self.__requested = set(self.__key(branch) for branch in branches if branch.pending and branch.commit and branch.upstreamCommit)
+
+        for key, future in list(self.__futures.items()):
+            if key not in self.__requested and key not in self.__exact and future.cancel():
+                del self.__futures[key]
+
+        action = profiler.currentAction()
+        for key in self.__requested:
+            if key not in self.__futures:
+                _, commit, upstreamCommit = key
+                self.__futures[key] = self.__executor.submit(self.__count, action, commit, upstreamCommit, False)
+
+    def requestExact(self, branch):
+        # counts stopped at the limit are only completed on demand, as that may take a while
+        if not branch.isDivergenceLimited():
+            return
+
+        key = self.__key(branch) + ('exact',)
+        if key not in self.__futures:
+            self.__exact.add(key)
+            self.__futures[key] = self.__executor.submit(self.__count, profiler.currentAction(), branch.commit, branch.upstreamCommit, True)
+
+    def __count(self, action, commit, upstreamCommit, exact):
+        with profiler.acting(action):
+            return self.__repository.countDivergence(commit, upstreamCommit, exact)
+
+    def collect(self):
+        changed = False
+        for key, future in list(self.__futures.items()):
+            if not future.done():
+                continue
+
+            del self.__futures[key]
+            self.__exact.discard(key)
+            branch = key[0]
+            # results for rows that left the viewport, or whose tips moved meanwhile, are dropped
+            if future.cancelled() or (key not in self.__requested and len(key) < 4) or key[:3] != self.__key(branch):
+                continue
+
+            try:
+                branch.setDivergence(future.result())
+            except GitCommandError:
+                branch.setDivergence(None)
+
+            changed = True
+
+        return changed
+
+    def isLoading(self):
+        return len(self.__futures) > 0
+
+    def shutdown(self):
+        self.reset()
+        self.__executor.shutdown(wait=False)
+        self.__repository.divergenceCache.save()
@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from git import GitCommandError
+
+from utils import profiler
+
+
+class RemoteFetcher:
+
+    RUNNING = '…'
+    DONE = '✓'
+    FAILED = '✗'
+
+    def __init__(self, repository):
+        super().__init__()
+        self.__repository = repository
+        self.__executor = None
+        self.__futures = {}
+        self.__states = {}
+
+    def start(self):
+        if self.isRunning():
+            return
+
+        names = [ remote.name for remote in self.__repository.remotes() ]
+        if not names:
+            return
+
+        self.__executor = ThreadPoolExecutor(max_workers=len(names))
+        self.__states = { name: RemoteFetcher.RUNNING for name in names }
+        action = profiler.currentAction()
+        self.__futures = { name: self.__executor.submit(self.__fetch, action, name) for name in names }
+
+    def __fetch(self, action, name):
+        with profiler.acting(action):
+            return self.__repository.fetchRemote(name)
+
+    def collect(self):
+        completed = []
+        for name, future in list(self.__futures.items()):
+            if not future.done():
+                continue
+
+            del self.__futures[name]
+            try:
+                completed.append((name, future.result()))
+                self.__states[name] = RemoteFetcher.DONE
+            except GitCommandError:
+                self.__states[name] = RemoteFetcher.FAILED
+
+        if self.__executor and not self.__futures:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
+
+        return completed
+
+    def isRunning(self):
+        return len(self.__futures) > 0
+
+    def status(self):
+        if not self.__states:
+            return ''
+
+        remotes = ' '.join('{} {}'.format(name, state) for name, state in self.__states.items())
+        if self.isRunning():
+            done = sum(1 for state in self.__states.values() if state != RemoteFetcher.RUNNING)
+            return 'fetching {}/{}: {}'.format(done, len(self.__states), remotes)
+
+        if RemoteFetcher.FAILED in self.__states.values():
+            return 'fetch failed: {}'.format(remotes)
+
+        return ''
+
+    def shutdown(self):
+        for future in self.__futures.values():
+            future.cancel()
+
+        if self.__executor:
+            self.__executor.shutdown(wait=False)
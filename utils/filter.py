@@ -0,0 +1,79 @@
+import heapq
+
+SEPARATORS = '/-_.'
+
+SUBSTRING_SCORE = 1000
+SEGMENT_BONUS = 10
+CONSECUTIVE_BONUS = 5
+
+
+class BranchFilter:
+
+    def __init__(self, branches):
+        super().__init__()
+        self.__entries = []
+        self.__sorted = []
+        self.__lastQuery = None
+        self.__lastMatches = []
+        self.add(branches)
+
+    def add(self, branches):
+        entries = [ (branch, branch.head.lower(), self.__segmentStarts(branch.head)) for branch in branches ]
+        self.__entries += entries
+        self.__sorted = list(heapq.merge(self.__sorted, sorted(branches, key=lambda branch: branch.head), key=lambda branch: branch.head))
+
+        # keeps narrowing down from the previous matches valid for branches that arrive while a query is active
+        if self.__lastQuery:
+            for entry in entries:
+                score = self.__score(self.__lastQuery, entry[1], entry[2])
+                if score is not None:
+                    self.__lastMatches.append((entry, score))
+
+    def __segmentStarts(self, name):
+        return frozenset([0] + [ i + 1 for i, character in enumerate(name) if character in SEPARATORS ])
+
+    def apply(self, query, descending=False):
+        query = query.lower()
+        if not query:
+            return list(reversed(self.__sorted)) if descending else list(self.__sorted)
+
+        if self.__lastQuery and query.startswith(self.__lastQuery):
+            candidates = [ entry for entry, _ in self.__lastMatches ]
+        else:
+            candidates = self.__entries
+
+        matches = []
+        for entry in candidates:
+            score = self.__score(query, entry[1], entry[2])
+            if score is not None:
+                matches.append((entry, score))
+
+        self.__lastQuery = query
+        self.__lastMatches = matches
+
+        ranked = sorted(matches, key=lambda match: match[0][0].head, reverse=descending)
+        ranked.sort(key=lambda match: match[1], reverse=True)
+        return [ entry[0] for entry, _ in ranked ]
+
+    def __score(self, query, name, segmentStarts):
+        position = name.find(query)
+        if position >= 0:
+            bonus = SEGMENT_BONUS if position in segmentStarts else 0
+            return SUBSTRING_SCORE + bonus - position
+
+        score = 0
+        last = -1
+        for character in query:
+            index = name.find(character, last + 1)
+            if index < 0:
+                return None
+
+            if index == last + 1:
+                score += CONSECUTIVE_BONUS
+            if index in segmentStarts:
+                score += SEGMENT_BONUS
+
+            score -= index - last - 1
+            last = index
+
+        return score
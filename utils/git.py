@@ -1,10 +1,89 @@
+import heapq
+import os
 import subprocess
+import time
+from collections import Counter
+from threading import Lock
 
-from git import Repo, RemoteReference, Head
+from git import Repo, Reference, GitCommandError
+from git.cmd import Git
+
+from utils import commitgraph, profiler
+from utils.cache import DivergenceCache
+from utils.profiler import TracedProcess
+from utils.refs import RefConfig, RefReader, matches, shorten
+
+
+class CountingGit(Git):
+
+    def __init__(self, working_dir=None):
+        super().__init__(working_dir)
+        self.spawned = Counter()
+        self.__lock = Lock()
+
+    def execute(self, command, *args, **kwargs):
+        name = next((part for part in command[1:] if not part.startswith('-')), command[0])
+        with self.__lock:
+            self.spawned[name] += 1
+
+        active = profiler.active()
+        if active is None:
+            return super().execute(command, *args, **kwargs)
+
+        started = time.perf_counter()
+        arguments = ' '.join(str(part) for part in command[1:])
+
+        def finish(received):
+            active.record('git', name, started, time.perf_counter(), command=arguments, bytes=received)
+
+        try:
+            result = super().execute(command, *args, **kwargs)
+        except Exception:
+            finish(None)
+            raise
+
+        if not kwargs.get('as_process'):
+            finish(CountingGit.outputSize(result))
+        elif name == 'cat-file':
+            # persistent processes serve many lookups, those are traced in get_object_header
+            finish(None)
+        else:
+            result = TracedProcess(result, finish)
+
+        return result
+
+    @staticmethod
+    def outputSize(result):
+        if isinstance(result, tuple):
+            return sum(CountingGit.outputSize(part) or 0 for part in result[1:])
+        if isinstance(result, str):
+            return len(result.encode())
+        if isinstance(result, bytes):
+            return len(result)
+        return None
+
+    def get_object_header(self, ref):
+        active = profiler.active()
+        if active is None:
+            return super().get_object_header(ref)
+
+        started = time.perf_counter()
+        try:
+            return super().get_object_header(ref)
+        finally:
+            active.record('git', 'cat-file --batch-check', started, time.perf_counter(), command=str(ref), bytes=None)
+
+
+class CountingRepo(Repo):
+
+    GitCommandWrapperType = CountingGit
 
 
 class File:
 
+    # status lists can hold hundreds of thousands of files, so instances carry no __dict__
+    __slots__ = ('__relative_path', '__tracked', '__staged', '__renamed', '__change_type')
+
     def untracked_file(relative_path):
         return File(relative_path, False, False, False, '?')
 
@@ -41,34 +120,339 @@ class File:
     def get_change_type(self):
         return self.__change_type
 
+    def is_added(self):
+        # the path is only in the index, there is no committed version to check out
+        return self.__staged and self.__change_type in ('A', 'R', 'C')
+
+    def to_dict(self):
+        return {
+            'path': self.__relative_path,
+            'tracked': self.__tracked,
+            'staged': self.__staged,
+            'renamed': self.__renamed,
+            'change_type': self.__change_type,
+        }
+
 
 class Repository:
 
+    # counts beyond are shown as 999+, as walking thousands of commits of a stale branch tells nothing more
+    DIVERGENCE_LIMIT = 999
+    LEFT = 1
+    RIGHT = 2
+    BOTH = LEFT | RIGHT
+    # walks over at least as many commits without a commit-graph suggest to write one
+    COMMIT_GRAPH_HINT = 1000
+    # the usual names of the branch everything else is merged into
+    BASE_CANDIDATES = [ 'main', 'master', 'develop' ]
+
     def __init__(self, directory):
         super().__init__()
-        self.repo = Repo(directory)
+        self.repo = CountingRepo(directory)
         self.__directory = directory
+        self.divergenceCache = DivergenceCache(os.path.join(self.repo.common_dir, DivergenceCache.FILENAME))
+        self.divergenceLimit = Repository.DIVERGENCE_LIMIT
+        # looked up once refs are first read, stage mostly gets by without them
+        self.__refReaderChecked = False
+        self.__refReader = None
+        self.__commitGraph = None
+        self.__commitGraphSignature = None
+        self.__commitGraphLock = Lock()
+        # 'missing' or 'stale' once divergence had to be counted the slow way
+        self.commitGraphWanted = None
 
     def getDirectory(self):
         return self.__directory
 
+    def spawnedProcesses(self):
+        return Counter(self.repo.git.spawned)
+
+    def resolve(self, revision):
+        try:
+            hexsha, _, _ = self.repo.git.get_object_header(revision)
+        except ValueError:
+            return None
+
+        return hexsha.decode()
+
     def active_branch(self):
         return self.repo.active_branch
 
     def active_branch_name(self):
         return self.active_branch().name
 
-    def getBranches(self, local=True, remotes=False):
-        refs = []
-        for ref in self.repo.refs:
-            if isinstance(ref, RemoteReference):
-                if remotes:
-                    refs.append(ref)
-            elif isinstance(ref, Head):
-                if local:
-                    refs.append(ref)
+    def getBranches(self, local=True, remotes=False, withDivergence=True):
+        patterns = (['refs/heads'] if local else []) + (['refs/remotes'] if remotes else [])
+        with profiler.phase('list refs'):
+            records = list(self.branchRecords(patterns)) if patterns else []
+
+        tips = self.refTips()
+        with profiler.phase('build branches', count=len(records)):
+            branches = [ Branch(self.repo, record, tips) for record in records ]
+
+        self.__applyCachedDivergence(branches)
+
+        misses = [ branch for branch in branches if branch.pending ]
+        if withDivergence and misses:
+            divergence = self.divergence([ branch.refname for branch in misses ])
+
+            for branch in misses:
+                counts = divergence.get(branch.refname)
+                branch.setDivergence(counts)
+
+                moved = self.resolve(branch.refname) != branch.commit or self.resolve(branch.upstreamRefname) != branch.upstreamCommit
+                if counts and not moved:
+                    self.divergenceCache.put(branch.commit, branch.upstreamCommit, counts)
+
+            self.divergenceCache.save()
+
+        return branches
+
+    def iterBranches(self, local=True, remotes=False):
+        # heads are read before remotes, so branches are handed out before the tips of their upstreams are known
+        tips = {}
+        branches = []
+        for record in self.branchRecords(['refs/heads', 'refs/remotes']):
+            tips[record.refname] = record.commit
+            if (record.remote is None and local) or (record.remote is not None and remotes):
+                branch = Branch(self.repo, record)
+                branches.append(branch)
+                yield branch
+
+        for branch in branches:
+            branch.refreshTips(tips)
+
+        self.__applyCachedDivergence(branches)
+
+    def updateBranches(self, branches, local=True, remotes=False):
+        # branches that neither moved nor got another upstream are kept, along with their divergence
+        known = { branch.refname: branch for branch in branches }
+        records = list(self.branchRecords(['refs/heads', 'refs/remotes']))
+        tips = { record.refname: record.commit for record in records }
+
+        result = []
+        updated = []
+        for record in records:
+            if (record.remote is None and not local) or (record.remote is not None and not remotes):
+                continue
+
+            branch = known.pop(record.refname, None)
+            if branch is None or branch.commit != record.commit or branch.upstreamRefname != record.upstreamRefname:
+                branch = Branch(self.repo, record, tips)
+                updated.append(branch)
+            elif branch.refreshTips(tips):
+                updated.append(branch)
+
+            result.append(branch)
+
+        self.__applyCachedDivergence(updated)
+        return result, len(updated) > 0 or len(known) > 0
+
+    def __applyCachedDivergence(self, branches):
+        for branch in branches:
+            if branch.pending:
+                cached = self.divergenceCache.get(branch.commit, branch.upstreamCommit)
+                if cached:
+                    branch.setDivergence(cached)
+
+    def __readableRefs(self):
+        # refs are read from the files directly, unless they are stored in a format only git itself understands
+        if not self.__refReaderChecked:
+            readable = RefConfig(self.repo.git).refStorage == 'files'
+            self.__refReader = RefReader(self.repo.git_dir, self.repo.common_dir) if readable else None
+            self.__refReaderChecked = True
+
+        return self.__refReader
+
+    def refTips(self, patterns=('refs/heads', 'refs/remotes')):
+        refReader = self.__readableRefs()
+        if refReader:
+            return { refname: objectname for refname, objectname in refReader.refs().items() if matches(refname, patterns) }
+
+        tips = {}
+        output = self.repo.git.for_each_ref('--format=%(refname)%00%(objectname)', *patterns)
+        for line in output.splitlines():
+            refname, objectname = line.split('\0')
+            tips[refname] = objectname
+
+        return tips
+
+    def divergence(self, refnames=None):
+        result = {}
+        patterns = refnames if refnames else ['refs/heads']
+        output = self.repo.git.for_each_ref('--format=%(refname)%00%(upstream)%00%(upstream:track,nobracket)', *patterns)
+        for line in output.splitlines():
+            refname, upstream, track = line.split('\0')
+            if not upstream or track == 'gone':
+                continue
+
+            result[refname] = Repository.parseTrack(track)
+
+        return result
+
+    @staticmethod
+    def parseTrack(track):
+        ahead, behind = 0, 0
+        for part in track.split(', '):
+            if part.startswith('ahead '):
+                ahead = int(part[len('ahead '):])
+            elif part.startswith('behind '):
+                behind = int(part[len('behind '):])
+
+        return (ahead, behind)
+
+    def streamBranches(self, local=True, remotes=False):
+        patterns = (['refs/heads'] if local else []) + (['refs/remotes'] if remotes else [])
+        if patterns:
+            yield from self.branchRecords(patterns, withDivergence=True)
+
+    def branchRecords(self, patterns, withDivergence=False):
+        if not withDivergence and self.__readableRefs():
+            return self.__readBranchRecords(patterns)
+
+        return self.__queryBranchRecords(patterns, withDivergence)
+
+    def __readBranchRecords(self, patterns):
+        with profiler.phase('read refs'):
+            config = RefConfig(self.repo.git)
+            refs = self.__refReader.refs()
+            active = self.__refReader.head()
+
+        remoteNames = sorted(config.remoteNames(), key=len, reverse=True)
+        for refname in sorted(refname for refname in refs if matches(refname, patterns)):
+            if refname.startswith('refs/heads/'):
+                head = refname[len('refs/heads/'):]
+                upstreamRefname = config.upstream(head)
+                upstream = shorten(upstreamRefname) if upstreamRefname else None
+                yield BranchRecord(refname, head, None, refs[refname], upstreamRefname, upstream, None, refname == active)
+            else:
+                yield self.__remoteBranchRecord(refname, refs[refname], remoteNames)
+
+    def __remoteBranchRecord(self, refname, commit, remoteNames):
+        # the longest name wins for remotes whose names are prefixes of each other, like origin and origin/mirror
+        name = refname[len('refs/remotes/'):]
+        remote = next((remote for remote in remoteNames if name.startswith(remote + '/')), name.split('/')[0])
+        return BranchRecord(refname, name[len(remote) + 1:], remote, commit, None, None, None, False)
+
+    def __queryBranchRecords(self, patterns, withDivergence):
+        fields = BranchRecord.FIELDS + ([ '%(upstream:track,nobracket)' ] if withDivergence else [])
+        remoteNames = sorted([ remote.name for remote in self.remotes() ], key=len, reverse=True)
+        process = self.repo.git.for_each_ref('--format=' + '%00'.join(fields), *patterns, as_process=True)
+        for line in process.stdout:
+            values = line.rstrip(b'\n').decode().split('\0')
+            refname, commit, symref, head, upstreamRefname, upstream = values[:6]
+            if symref:
+                continue
+
+            if refname.startswith('refs/heads/'):
+                track = values[6] if withDivergence else ''
+                divergence = Repository.parseTrack(track) if withDivergence and upstream and track != 'gone' else None
+                yield BranchRecord(refname, refname[len('refs/heads/'):], None, commit, upstreamRefname or None, upstream or None, divergence, head == '*')
+            else:
+                yield self.__remoteBranchRecord(refname, commit, remoteNames)
+
+        process.wait()
+
+    def countDivergence(self, commit, upstreamCommit, exact=False):
+        limit = None if exact else self.divergenceLimit
+        cached = self.divergenceCache.get(commit, upstreamCommit)
+        # limited counts are stored along with their limit, and only serve limits that are not higher
+        if cached and (len(cached) < 3 or (limit and cached[2] >= limit)):
+            return cached
+
+        graph = self.commitGraph()
+        covered = graph is not None and graph.covers(commit) and graph.covers(upstreamCommit)
+        if limit and covered:
+            counts = self.__walkCommitGraph(graph, commit, upstreamCommit, limit)
+        else:
+            # only generation numbers tell when a walk may stop early, without them commit dates can be skewed and
+            # commits shared by both sides would be counted for one of them, so git counts the whole range
+            output = self.repo.git.rev_list('--left-right', '--count', '{}...{}'.format(upstreamCommit, commit))
+            behind, ahead = output.split()
+            counts = (int(ahead), int(behind))
+
+        if not covered and counts[0] + counts[1] >= Repository.COMMIT_GRAPH_HINT:
+            self.commitGraphWanted = 'stale' if graph else 'missing'
+
+        self.divergenceCache.put(commit, upstreamCommit, counts)
+        return counts
+
+    def __walkCommitGraph(self, graph, commit, upstreamCommit, limit):
+        # generation numbers hand out every commit after all of its children, so its flags are final once it is taken
+        # and the walk is done as soon as only commits reachable from both sides are left
+        flags = {}
+        queue = []
+        for sha, side in [ (upstreamCommit, Repository.LEFT), (commit, Repository.RIGHT) ]:
+            position = graph.position(sha)
+            if position not in flags:
+                heapq.heappush(queue, (-graph.generation(position), position))
+            flags[position] = flags.get(position, 0) | side
+
+        unresolved = sum(1 for side in flags.values() if side != Repository.BOTH)
+        counts = { Repository.LEFT: 0, Repository.RIGHT: 0, Repository.BOTH: 0 }
+        while unresolved and counts[Repository.LEFT] <= limit and counts[Repository.RIGHT] <= limit:
+            _, position = heapq.heappop(queue)
+            side = flags[position]
+            counts[side] += 1
+            if side != Repository.BOTH:
+                unresolved -= 1
+
+            for parent in graph.parents(position):
+                previous = flags.get(parent)
+                if previous is None:
+                    flags[parent] = side
+                    heapq.heappush(queue, (-graph.generation(parent), parent))
+                    if side != Repository.BOTH:
+                        unresolved += 1
+                elif previous | side != previous:
+                    flags[parent] = Repository.BOTH
+                    unresolved -= 1
+
+        return self.__limitCounts(counts[Repository.RIGHT], counts[Repository.LEFT], limit)
+
+    def commitGraph(self):
+        # read again once git wrote another one, e.g. on gc or a fetch with fetch.writeCommitGraph
+        objects = os.path.join(self.repo.common_dir, 'objects')
+        current = commitgraph.signature(objects)
+        with self.__commitGraphLock:
+            if current != self.__commitGraphSignature:
+                with profiler.phase('read commit-graph'):
+                    self.__commitGraph = commitgraph.load(objects)
+                self.__commitGraphSignature = current
+
+            return self.__commitGraph
+
+    def writeCommitGraph(self):
+        # split graphs only get a layer of the commits added since, which git merges with the others as they grow
+        self.repo.git.commit_graph('write', '--reachable', '--split')
+        self.commitGraphWanted = None
+
+    def isAncestor(self, ancestor, descendant):
+        # generation numbers of a commit-graph let git stop long before the root
+        try:
+            self.repo.git.merge_base('--is-ancestor', ancestor, descendant)
+        except GitCommandError as e:
+            if e.status == 1:
+                return False
+            raise
+
+        return True
+
+    def __limitCounts(self, ahead, behind, limit):
+        if ahead > limit or behind > limit:
+            # the other count is only known to be at least as high
+            return (min(ahead, limit + 1), min(behind, limit + 1), limit)
+
+        return (ahead, behind)
 
-        return [ Branch(ref, self.repo) for ref in refs ]
+    def defaultBase(self):
+        tips = self.refTips(['refs/heads'])
+        return next((name for name in Repository.BASE_CANDIDATES if 'refs/heads/' + name in tips), None)
+
+    def mergedBranches(self, base):
+        # a single walk from the base answers for all heads at once, and git reads the commit-graph for it
+        output = self.repo.git.for_each_ref('--merged=' + base, '--format=%(refname)', 'refs/heads')
+        return set(output.splitlines())
 
     def remotes(self):
         return self.repo.remotes
@@ -77,62 +461,248 @@ class Repository:
         for remote in self.repo.remotes:
             remote.fetch()
 
+    def fetchRemote(self, name):
+        pattern = 'refs/remotes/{}/'.format(name)
+        before = self.refTips([pattern])
+        # concurrent fetches would race on FETCH_HEAD, which nothing here reads
+        self.repo.git.fetch('--no-write-fetch-head', name)
+        after = self.refTips([pattern])
+
+        return set(refname for refname in set(before) | set(after) if before.get(refname) != after.get(refname))
+
+    def getBranchesAt(self, refnames, tips):
+        refnames = set(refnames)
+        # patterns also match refs below the given ones, e.g. origin/a/b for origin/a
+        return [ Branch(self.repo, record, tips) for record in self.branchRecords(sorted(refnames)) if record.refname in refnames ]
+
     def hasDetachedHead(self):
         return self.repo.head.is_detached
 
+    def ignoredDirectories(self):
+        output = self.repo.git.ls_files('--others', '--ignored', '--exclude-standard', '--directory', '-z')
+        return set(path.rstrip('/') for path in output.split('\0') if path.endswith('/'))
+
 class Branch:
 
-    def __init__(self, reference, repo):
+    __slots__ = ('__repo', 'refname', 'head', 'remote', 'commitsBehind', 'commitsAhead', 'divergenceLimit', 'upstream', 'upstreamRefname', 'commit', 'upstreamCommit', 'pending')
+
+    def __init__(self, repo, record, tips=None):
         super().__init__()
-        self.head = reference.remote_head if isinstance(reference, RemoteReference) else reference.name
-        self.remote = reference.remote_name if isinstance(reference, RemoteReference) else None
-        self.reference = reference
+        self.__repo = repo
+        self.refname = record.refname
+        self.head = record.head
+        self.remote = record.remote
         self.commitsBehind = None
         self.commitsAhead = None
-        self.upstream = reference.tracking_branch()
+        self.divergenceLimit = None
+        self.upstream = record.upstream
+        self.upstreamRefname = record.upstreamRefname
+        self.commit = None
+        self.upstreamCommit = None
+        # branches with an upstream wait for their divergence until the tips are known
+        self.pending = self.upstreamRefname is not None
+        if tips is not None:
+            self.refreshTips(tips)
+
+    def getReference(self):
+        return Reference.from_path(self.__repo, self.refname)
+
+    @property
+    def diff(self):
+        # only the visible rows ask for the label, so it is not kept per branch
+        # once one count stopped at the limit, the other one is only a lower bound and shown even if it is 0
+        limited = self.isDivergenceLimited()
+        diff = ''
+        if self.commitsAhead or (limited and self.commitsAhead is not None):
+            diff += '↑·' + self.__formatCount(self.commitsAhead, limited)
+
+        if self.commitsBehind or (limited and self.commitsBehind is not None):
+            diff += '↓·' + self.__formatCount(self.commitsBehind, limited)
+
+        return diff
+
+    def refreshTips(self, tips):
+        commit = tips.get(self.refname)
+        upstreamCommit = tips.get(self.upstreamRefname) if self.upstreamRefname else None
+        if (commit, upstreamCommit) == (self.commit, self.upstreamCommit) and self.commit is not None:
+            return False
+
+        self.commit = commit
+        self.upstreamCommit = upstreamCommit
+        self.pending = self.commit is not None and self.upstreamCommit is not None
+        if not self.pending:
+            self.setDivergence(None)
+
+        return True
+
+    def setDivergence(self, divergence):
+        self.pending = False
+        self.commitsAhead, self.commitsBehind = divergence[:2] if self.upstream and divergence else (None, None)
+        # counts stopped at a limit come with it
+        self.divergenceLimit = divergence[2] if self.upstream and divergence and len(divergence) > 2 else None
+
+    def isDivergenceLimited(self):
+        limit = self.divergenceLimit
+        return limit is not None and ((self.commitsAhead or 0) > limit or (self.commitsBehind or 0) > limit)
+
+    def __formatCount(self, count, limited):
+        if not limited:
+            return str(count)
+
+        return '{}+'.format(min(count, self.divergenceLimit))
+
+    def __repr__(self):
+        diff = ', diff={}'.format(self.diff) if self.diff else ''
+        return '<Branch head={}, remote={}, upstream={}{} >'.format(self.head, self.remote, self.upstream, diff)
+
 
-        if self.upstream:
-            commitsBehind = repo.iter_commits('{}..{}'.format(self.head, self.upstream))
-            self.commitsBehind = sum(1 for c in commitsBehind)
+class BranchRecord:
 
-            commitsAhead = repo.iter_commits('{}..{}'.format(self.upstream, self.head))
-            self.commitsAhead = sum(1 for c in commitsAhead)
+    FIELDS = [ '%(refname)', '%(objectname)', '%(symref)', '%(HEAD)', '%(upstream)', '%(upstream:short)' ]
 
-        self.diff = ''
-        if self.commitsAhead:
-            self.diff += '↑·{}'.format(self.commitsAhead)
+    __slots__ = ('refname', 'head', 'remote', 'commit', 'upstreamRefname', 'upstream', 'commitsAhead', 'commitsBehind', 'active')
 
-        if self.commitsBehind:
-            self.diff += '↓·{}'.format(self.commitsBehind)
+    def __init__(self, refname, head, remote, commit, upstreamRefname, upstream, divergence, active):
+        super().__init__()
+        self.refname = refname
+        self.head = head
+        self.remote = remote
+        self.commit = commit
+        self.upstreamRefname = upstreamRefname
+        self.upstream = upstream
+        self.commitsAhead, self.commitsBehind = divergence if divergence else (None, None)
+        self.active = active
+
+    def toDict(self):
+        return {
+            'name': self.head,
+            'remote': self.remote,
+            'refname': self.refname,
+            'commit': self.commit,
+            'upstream': self.upstream,
+            'ahead': self.commitsAhead,
+            'behind': self.commitsBehind,
+            'active': self.active,
+        }
 
     def __repr__(self):
-        diff = ', diff={}'.format(self.diff) if self.diff and len(self.diff) else ''
-        return '<Branch head={}, remote={}, upstream={}{} >'.format(self.head, self.remote, self.upstream, diff)
+        return '<BranchRecord head={}, remote={}, upstream={} >'.format(self.head, self.remote, self.upstream)
 
 
 class Stage(Repository):
 
+    STATUS_CHUNK_SIZE = 64 * 1024
+    STATUS_FIELD_COUNTS = { b'1': 8, b'2': 9, b'u': 10 }
+
     def __init__(self, directory):
         super().__init__(directory)
+        self.__index_signature = None
+        self.__staged_entries = None
+        self.__touched_paths = set()
+
+    def status(self, path=None):
+        return self.status_paths(None if path is None else [path])
+
+    def status_paths(self, paths):
+        tracked = []
+        untracked = []
+        with profiler.phase('status', paths=None if paths is None else len(paths)):
+            for file in self.__status_files(paths):
+                if file.is_tracked():
+                    tracked.append(file)
+                else:
+                    untracked.append(file)
+
+        self.__index_signature = self.__read_index_signature()
+
+        # git reports changed, unmerged and untracked entries as three runs, each already sorted by path,
+        # sorting finds the first two as runs and only merges them
+        tracked.sort(key=lambda file: file.get_relative_path())
+        return list(heapq.merge(tracked, untracked, key=lambda file: file.get_relative_path()))
+
+    def stream_status(self, path=None):
+        # changed entries come first, unmerged and untracked ones follow, each run sorted by path
+        return self.__status_files(None if path is None else [path])
+
+    def index_changes(self):
+        # compares the staged entries against those of the previous call, which is far cheaper than a status as the working tree is not looked at
+        try:
+            output = self.repo.git.diff_index('--cached', '--raw', '-z', '--no-renames', 'HEAD')
+            fields = output.split('\0')
+            entries = dict(zip(fields[1::2], fields[0::2]))
+        except GitCommandError:
+            # there is no commit yet
+            entries = None
 
-    def status(self):
-        result = self.__staged_files() + self.__unstaged_files() + self.__untracked_files()
-        result.sort(key= lambda file: file.get_relative_path())
-        return result
+        previous, self.__staged_entries = self.__staged_entries, entries
+        touched, self.__touched_paths = self.__touched_paths, set()
+        if previous is None or entries is None:
+            return None
+
+        # entries changed by this stage and changed back by someone else look unchanged, so those are re-checked as well
+        return set(path for path in set(previous) | set(entries) if previous.get(path) != entries.get(path)) | touched
 
-    def __staged_files(self):
-        return [File.from_diff(diff, True) for diff in self.repo.index.diff(self.repo.head.commit)]
+    def has_external_changes(self):
+        return self.__index_signature != self.__read_index_signature()
 
-    def __unstaged_files(self):
-        return [File.from_diff(diff, False) for diff in self.repo.index.diff(None)]
+    def __read_index_signature(self):
+        try:
+            stat = os.stat(os.path.join(self.repo.git_dir, 'index'))
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def __status_fields(self, paths):
+        pathspec = ['--'] + [ ':(literal)' + path for path in paths ] if paths is not None else []
+        process = self.repo.git.status('--porcelain=v2', '-z', '--untracked-files=all', *pathspec, as_process=True)
+        remainder = b''
+        while True:
+            chunk = process.stdout.read(Stage.STATUS_CHUNK_SIZE)
+            if not chunk:
+                break
+
+            fields = (remainder + chunk).split(b'\0')
+            remainder = fields.pop()
+            yield from fields
+
+        process.wait()
+
+    def __status_files(self, paths):
+        fields = self.__status_fields(paths)
+        for field in fields:
+            kind = field[:1]
+
+            if kind == b'?':
+                yield File.untracked_file(os.fsdecode(field[2:]))
+                continue
+
+            if kind not in Stage.STATUS_FIELD_COUNTS:
+                continue
 
-    def __untracked_files(self):
-        return [File.untracked_file(f) for f in self.repo.untracked_files]
+            parts = field.split(b' ', Stage.STATUS_FIELD_COUNTS[kind])
+            path = os.fsdecode(parts[-1])
+
+            if kind == b'u':
+                yield File(path, True, False, False, 'M')
+                continue
+
+            renamed = kind == b'2'
+            if renamed:
+                next(fields)
+
+            staged_type, unstaged_type = parts[1].decode()
+            if staged_type != '.':
+                yield File(path, True, True, renamed and staged_type == 'R', staged_type)
+            if unstaged_type != '.':
+                yield File(path, True, False, renamed and unstaged_type == 'R', unstaged_type)
 
     def stash_all(self):
+        self.__staged_entries = None
         self.repo.git.stash()
 
     def pop_stash(self):
+        self.__staged_entries = None
         self.repo.git.stash('pop')
 
     def ignore(self, untracked_file):
@@ -145,20 +715,48 @@ class Stage(Repository):
             gitignore_file.close()
 
     def checkout(self, file):
-        if file.is_staged():
-            self.reset(file)
+        self.checkout_files([file])
+
+    def checkout_files(self, files):
+        files = [file for file in files if not file.is_added()]
+        staged = set(file.get_relative_path() for file in files if file.is_staged())
 
-        self.repo.git.checkout(file.get_relative_path())
+        # changes only made to the working tree are taken back from the index, which stays as it is
+        self.__run_with_pathspecs(['checkout'], [file for file in files if file.get_relative_path() not in staged])
+        # staged paths are taken from HEAD into both, git checks all of them before it writes any
+        self.__run_with_pathspecs(['checkout', 'HEAD'], [file for file in files if file.get_relative_path() in staged])
 
     def add(self, file):
-        self.repo.git.add(file.get_relative_path())
+        self.add_files([file])
+
+    def add_files(self, files):
+        self.__run_with_pathspecs(['add'], files)
 
     def add_all(self):
+        self.__staged_entries = None
         self.repo.git.add('-A')
 
     def reset(self, file):
-        subprocess.Popen('git reset HEAD -- ' + file.get_relative_path(), shell=True).wait()
+        self.reset_files([file])
+
+    def reset_files(self, files):
+        # without a commit to reset to, as in a new repository, git removes the paths from the index
+        self.__run_with_pathspecs(['reset'], files)
+
+    def __run_with_pathspecs(self, arguments, files):
+        paths = sorted(set(file.get_relative_path() for file in files))
+        if not paths:
+            return
+
+        self.__touched_paths.update(paths)
+        command = ['git', '--literal-pathspecs'] + arguments + ['--pathspec-from-file=-', '--pathspec-file-nul']
+        pathspecs = b'\0'.join(os.fsencode(path) for path in paths)
+        process = self.repo.git.execute(command, istream=subprocess.PIPE, as_process=True)
+        stdout, stderr = process.communicate(pathspecs)
+        if process.proc.returncode != 0:
+            raise GitCommandError(command, process.proc.returncode, stderr, stdout)
 
     def reset_all(self):
-        self.repo.git.reset('HEAD')
+        self.__staged_entries = None
+        self.repo.git.reset()
 
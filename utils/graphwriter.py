@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from git import GitCommandError
+
+from utils import profiler
+
+
+class CommitGraphWriter:
+
+    def __init__(self, repository):
+        super().__init__()
+        self.__repository = repository
+        self.__executor = None
+        self.__future = None
+        self.__failed = False
+
+    def start(self):
+        if self.isRunning():
+            return
+
+        self.__failed = False
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__future = self.__executor.submit(self.__write, profiler.currentAction())
+
+    def __write(self, action):
+        with profiler.acting(action):
+            self.__repository.writeCommitGraph()
+
+    def collect(self):
+        if self.__future is None or not self.__future.done():
+            return False
+
+        try:
+            self.__future.result()
+        except GitCommandError:
+            self.__failed = True
+
+        self.__future = None
+        self.__executor.shutdown(wait=False)
+        self.__executor = None
+        return True
+
+    def isRunning(self):
+        return self.__future is not None
+
+    def isWanted(self):
+        return not self.isRunning() and self.__repository.commitGraphWanted is not None
+
+    def status(self):
+        if self.isRunning():
+            return 'writing commit-graph …'
+
+        if self.__failed:
+            return 'writing commit-graph failed'
+
+        wanted = self.__repository.commitGraphWanted
+        if wanted == 'missing':
+            return 'no commit-graph, [G] writes one'
+        if wanted == 'stale':
+            return 'commit-graph outdated, [G] updates it'
+
+        return ''
+
+    def shutdown(self):
+        # git replaces the graph files atomically, so a write in progress is left to finish on its own
+        if self.__executor:
+            self.__executor.shutdown(wait=False)
@@ -0,0 +1,22 @@
+import curses
+from contextlib import contextmanager
+
+PAIR_SHIFT = 8
+
+
+def colorPair(pair):
+    return pair << PAIR_SHIFT
+
+
+@contextmanager
+def headlessCurses():
+    # color pairs and the cursor can only be set up once a terminal was initialised
+    originals = (curses.color_pair, curses.init_pair, curses.curs_set, curses.doupdate)
+    curses.color_pair = colorPair
+    curses.init_pair = lambda pair, foreground, background: None
+    curses.curs_set = lambda visibility: 0
+    curses.doupdate = lambda: None
+    try:
+        yield
+    finally:
+        curses.color_pair, curses.init_pair, curses.curs_set, curses.doupdate = originals
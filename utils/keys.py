@@ -0,0 +1,14 @@
+import curses
+
+# the names keys go by in replay scripts and in the actions of a trace
+KEY_NAMES = {
+    'UP': curses.KEY_UP,
+    'DOWN': curses.KEY_DOWN,
+    'LEFT': curses.KEY_LEFT,
+    'RIGHT': curses.KEY_RIGHT,
+    'ENTER': ord('\n'),
+    'ESC': 27,
+    'BACKSPACE': 127,
+    'SPACE': ord(' '),
+    'RESIZE': curses.KEY_RESIZE,
+}
@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from git import GitCommandError
+
+from utils import profiler
+
+
+class MergedLoader:
+
+    def __init__(self, repository, base):
+        super().__init__()
+        self.__repository = repository
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__future = None
+        self.__outdated = False
+        self.base = base
+        self.merged = set()
+
+    def request(self):
+        if self.base is None:
+            return
+
+        # refs moving while a query runs are picked up by another one once it finished
+        if self.__future is not None:
+            self.__outdated = True
+            return
+
+        self.__future = self.__executor.submit(self.__query, profiler.currentAction())
+
+    def __query(self, action):
+        with profiler.acting(action):
+            return self.__repository.mergedBranches(self.base)
+
+    def collect(self):
+        if self.__future is None or not self.__future.done():
+            return False
+
+        try:
+            self.merged = self.__future.result()
+        except GitCommandError:
+            # the base does not exist (anymore)
+            self.merged = set()
+
+        self.__future = None
+        if self.__outdated:
+            self.__outdated = False
+            self.request()
+
+        return True
+
+    def isLoading(self):
+        return self.__future is not None
+
+    def shutdown(self):
+        if self.__future is not None:
+            self.__future.cancel()
+
+        self.__executor.shutdown(wait=False)
@@ -0,0 +1,18 @@
+import json
+import os
+import sys
+
+
+def write(records, stream=None):
+    stream = stream or sys.stdout
+    try:
+        for record in records:
+            stream.write(json.dumps(record) + '\n')
+            # consumers shall see every record as soon as it was produced
+            stream.flush()
+    except BrokenPipeError:
+        # the consumer stopped reading, e.g. head, which is no error; keep the interpreter from failing to flush on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+        return False
+
+    return True
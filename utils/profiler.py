@@ -0,0 +1,214 @@
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from threading import Lock, current_thread, local
+
+from utils.keys import KEY_NAMES
+
+
+class Profiler:
+
+    def __init__(self):
+        super().__init__()
+        self.__started = time.perf_counter()
+        self.__events = []
+        self.__lock = Lock()
+        self.__local = local()
+        self.__action = 'startup'
+        self.__threads = {}
+
+    def __timestamp(self, moment):
+        return (moment - self.__started) * 1000000
+
+    def currentAction(self):
+        return getattr(self.__local, 'action', None) or self.__action
+
+    def setAction(self, action):
+        self.__action = action
+
+    @contextmanager
+    def acting(self, action):
+        # background work is attributed to the action that requested it, not the one running meanwhile
+        previous = getattr(self.__local, 'action', None)
+        self.__local.action = action
+        try:
+            yield
+        finally:
+            self.__local.action = previous
+
+    def record(self, category, name, started, finished, **args):
+        args['action'] = self.currentAction()
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': self.__timestamp(started),
+            'dur': (finished - started) * 1000000,
+            'pid': os.getpid(),
+            'tid': current_thread().ident,
+            'args': args,
+        }
+        with self.__lock:
+            self.__threads[current_thread().ident] = current_thread().name
+            self.__events.append(event)
+
+    @contextmanager
+    def phase(self, name, **args):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record('python', name, started, time.perf_counter(), **args)
+
+    @contextmanager
+    def command(self, name, arguments):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record('git', name, started, time.perf_counter(), command=arguments, bytes=None)
+
+    def events(self):
+        with self.__lock:
+            return list(self.__events)
+
+    def save(self, path):
+        with self.__lock:
+            threads = [ { 'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': ident, 'args': { 'name': name } } for ident, name in self.__threads.items() ]
+
+        with open(path, 'w') as file:
+            json.dump({ 'traceEvents': threads + self.events(), 'displayTimeUnit': 'ms' }, file)
+
+    def printSummary(self, file=sys.stderr):
+        events = self.events()
+
+        for category, title in [ ('git', 'git command'), ('python', 'phase') ]:
+            groups = OrderedDict()
+            for event in sorted(events, key=lambda event: event['name']):
+                if event['cat'] == category:
+                    groups.setdefault(event['name'], []).append(event)
+
+            print('{:<24} {:>7} {:>11} {:>10} {:>10} {:>12}'.format(title, 'calls', 'total [ms]', 'mean [ms]', 'max [ms]', 'bytes read'), file=file)
+            for name, group in sorted(groups.items(), key=lambda item: -sum(event['dur'] for event in item[1])):
+                durations = [ event['dur'] / 1000 for event in group ]
+                received = sum(event['args'].get('bytes') or 0 for event in group)
+                print('{:<24} {:>7} {:>11.1f} {:>10.1f} {:>10.1f} {:>12}'.format(
+                    name[:24], len(group), sum(durations), sum(durations) / len(group), max(durations), received if category == 'git' else ''), file=file)
+            print(file=file)
+
+        actions = OrderedDict()
+        for event in events:
+            if event['cat'] == 'git':
+                calls, duration = actions.get(event['args']['action'], (0, 0))
+                actions[event['args']['action']] = (calls + 1, duration + event['dur'] / 1000)
+
+        print('{:<24} {:>7} {:>11}'.format('git time per action', 'calls', 'total [ms]'), file=file)
+        for action, (calls, duration) in sorted(actions.items(), key=lambda item: -item[1][1]):
+            print('{:<24} {:>7} {:>11.1f}'.format(action[:24], calls, duration), file=file)
+
+
+class TracedProcess:
+
+    def __init__(self, process, finish):
+        super().__init__()
+        self.__process = process
+        self.__finish = finish
+        self.__received = 0
+        self.stdout = TracedStream(process.stdout, self)
+
+    def __getattr__(self, name):
+        return getattr(self.__process, name)
+
+    def received(self, count):
+        self.__received += count
+
+    def wait(self, *args, **kwargs):
+        try:
+            return self.__process.wait(*args, **kwargs)
+        finally:
+            self.__finish(self.__received)
+
+    def communicate(self, *args, **kwargs):
+        stdout, stderr = self.__process.proc.communicate(*args, **kwargs)
+        self.__finish(len(stdout or b'') + len(stderr or b''))
+        return stdout, stderr
+
+
+class TracedStream:
+
+    def __init__(self, stream, process):
+        super().__init__()
+        self.__stream = stream
+        self.__process = process
+
+    def __getattr__(self, name):
+        return getattr(self.__stream, name)
+
+    def __iter__(self):
+        return iter(self.readline, b'')
+
+    def read(self, *args):
+        data = self.__stream.read(*args)
+        self.__process.received(len(data))
+        return data
+
+    def readline(self, *args):
+        line = self.__stream.readline(*args)
+        self.__process.received(len(line))
+        return line
+
+
+_profiler = None
+
+
+def enable():
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def active():
+    return _profiler
+
+
+def phase(name, **args):
+    return _profiler.phase(name, **args) if _profiler else nullcontext()
+
+
+def command(name, arguments):
+    return _profiler.command(name, arguments) if _profiler else nullcontext()
+
+
+def setAction(action):
+    if _profiler:
+        _profiler.setAction(action)
+
+
+def currentAction():
+    return _profiler.currentAction() if _profiler else None
+
+
+def acting(action):
+    return _profiler.acting(action) if _profiler and action else nullcontext()
+
+
+def keyAction(key):
+    for name, code in KEY_NAMES.items():
+        if code == key:
+            return 'key ' + name
+
+    return 'key ' + (chr(key) if 32 < key < 127 else str(key))
+
+
+def defaultTracePath(program):
+    return os.path.join(tempfile.gettempdir(), '{}-trace-{}.json'.format(program, os.getpid()))
+
+
+def finish(path):
+    _profiler.save(path)
+    _profiler.printSummary()
+    print('\ntrace written to {} (open it in chrome://tracing or ui.perfetto.dev)'.format(path), file=sys.stderr)
@@ -0,0 +1,128 @@
+import os
+
+from git import GitCommandError
+
+HEADS = 'refs/heads/'
+REMOTES = 'refs/remotes/'
+CONFIG_KEYS = r'^(branch\..*\.(remote|merge)|remote\..*\.fetch|extensions\.refstorage)$'
+
+
+def matches(refname, patterns):
+    # the way git for-each-ref matches literal patterns: completely or up to a slash
+    for pattern in patterns:
+        if refname == pattern or refname.startswith(pattern if pattern.endswith('/') else pattern + '/'):
+            return True
+
+    return False
+
+
+def shorten(refname):
+    for prefix in [ REMOTES, HEADS ]:
+        if refname.startswith(prefix):
+            return refname[len(prefix):]
+
+    return refname
+
+
+class RefConfig:
+
+    def __init__(self, git):
+        super().__init__()
+        self.refStorage = 'files'
+        self.__branches = {}
+        self.__fetchRefspecs = {}
+
+        try:
+            output = git.config('-z', '--get-regexp', CONFIG_KEYS)
+        except GitCommandError as e:
+            # git config exits with 1 if no key matched
+            if e.status != 1:
+                raise
+            output = ''
+
+        for entry in output.split('\0'):
+            key, _, value = entry.partition('\n')
+            section, _, rest = key.partition('.')
+            subsection, _, variable = rest.rpartition('.')
+
+            if section == 'branch':
+                self.__branches.setdefault(subsection, {})[variable] = value
+            elif section == 'remote':
+                self.__fetchRefspecs.setdefault(subsection, []).append(value)
+            elif section == 'extensions' and key == 'extensions.refstorage':
+                self.refStorage = value
+
+    def remoteNames(self):
+        return list(self.__fetchRefspecs)
+
+    def upstream(self, branchName):
+        branch = self.__branches.get(branchName, {})
+        remote, merge = branch.get('remote'), branch.get('merge')
+        if not remote or not merge:
+            return None
+
+        if remote == '.':
+            return merge
+
+        for refspec in self.__fetchRefspecs.get(remote, []):
+            source, _, destination = refspec.lstrip('+').partition(':')
+            if '*' in source:
+                prefix, _, suffix = source.partition('*')
+                if merge.startswith(prefix) and merge.endswith(suffix) and len(merge) >= len(prefix) + len(suffix):
+                    return destination.replace('*', merge[len(prefix):len(merge) - len(suffix)], 1)
+            elif source == merge and destination:
+                return destination
+
+        return None
+
+
+class RefReader:
+
+    def __init__(self, gitDir, commonDir):
+        super().__init__()
+        self.__gitDir = gitDir
+        self.__commonDir = commonDir
+
+    def refs(self):
+        refs = {}
+        try:
+            with open(os.path.join(self.__commonDir, 'packed-refs'), 'rb') as file:
+                for line in file:
+                    objectname, _, refname = line.rstrip(b'\n').partition(b' ')
+                    # the header, peeled lines and tags are skipped before anything is decoded
+                    if refname.startswith((b'refs/heads/', b'refs/remotes/')):
+                        refs[refname.decode()] = objectname.decode()
+        except FileNotFoundError:
+            pass
+
+        for prefix in [ HEADS, REMOTES ]:
+            root = os.path.join(self.__commonDir, prefix)
+            for directory, _, files in os.walk(root):
+                for name in files:
+                    if name.endswith('.lock'):
+                        continue
+
+                    path = os.path.join(directory, name)
+                    try:
+                        with open(path) as file:
+                            content = file.read().strip()
+                    except (FileNotFoundError, IsADirectoryError):
+                        # deleted while walking
+                        continue
+
+                    refname = prefix + os.path.relpath(path, root).replace(os.sep, '/')
+                    if content.startswith('ref:'):
+                        refs.pop(refname, None)
+                    else:
+                        refs[refname] = content
+
+        return refs
+
+    def head(self):
+        try:
+            with open(os.path.join(self.__gitDir, 'HEAD')) as file:
+                content = file.read().strip()
+        except FileNotFoundError:
+            return None
+
+        return content[len('ref:'):].strip() if content.startswith('ref:') else None
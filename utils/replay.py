@@ -0,0 +1,209 @@
+import curses
+import math
+import re
+import time
+from collections import Counter, OrderedDict
+
+from utils.headless import headlessCurses
+from utils.keys import KEY_NAMES
+
+# sent once the script is exhausted, leaving filter and glob inputs before quitting
+QUIT_KEYS = [ KEY_NAMES['ESC'], ord('q') ]
+
+SETTLE_TIMEOUT = 5.0
+
+
+class ReplayFinished(Exception):
+    pass
+
+
+def parseScript(text):
+    keys = []
+    for line in re.split(r'[;\n]', text):
+        words = line.split(None, 1)
+        if not words or words[0].startswith('#'):
+            continue
+
+        command, argument = words[0], words[1] if len(words) > 1 else ''
+        if command == 'type':
+            keys += [ ('type', ord(character)) for character in argument ]
+
+        elif command == 'key':
+            parts = argument.split()
+            if not parts:
+                raise ValueError('key requires a name: {}'.format(line.strip()))
+
+            name = parts[0]
+            count = int(parts[1]) if len(parts) > 1 else 1
+            if name.upper() in KEY_NAMES:
+                code = KEY_NAMES[name.upper()]
+                name = name.upper()
+            elif len(name) == 1:
+                code = ord(name)
+            else:
+                raise ValueError('unknown key: {}'.format(name))
+
+            keys += [ (name, code) ] * count
+
+        else:
+            raise ValueError('unknown script command: {}'.format(command))
+
+    return keys
+
+
+class KeySample:
+
+    def __init__(self, label):
+        super().__init__()
+        self.label = label
+        self.latency = None
+        self.settled = None
+        self.frames = 0
+        self.cells = 0
+        self.gitCalls = Counter()
+
+
+class FakeScreen:
+
+    def __init__(self, keys, height=50, width=160, gitCalls=None, settleTimeout=SETTLE_TIMEOUT):
+        super().__init__()
+        self.__keys = list(keys)
+        self.__height = height
+        self.__width = width
+        self.__gitCalls = gitCalls or Counter
+        self.__settleTimeout = settleTimeout
+        self.__delay = -1
+        self.__quitKeys = list(QUIT_KEYS)
+        self.__sample = None
+        self.__delivered = None
+        self.__gitBefore = None
+        self.samples = []
+        self.frames = 0
+        self.cells = 0
+
+    def getmaxyx(self):
+        return (self.__height, self.__width)
+
+    def getbegyx(self):
+        return (0, 0)
+
+    def addstr(self, *args):
+        self.cells += 1
+
+    addnstr = addch = insstr = addstr
+
+    def noutrefresh(self):
+        self.frames += 1
+        if self.__sample:
+            self.__sample.frames += 1
+
+    def refresh(self):
+        self.noutrefresh()
+
+    def timeout(self, delay):
+        self.__delay = delay
+
+    def nodelay(self, flag):
+        self.__delay = 0 if flag else -1
+
+    def __getattr__(self, name):
+        # moving the cursor, attributes, clearing and other calls that only affect the terminal
+        return lambda *args: None
+
+    def __finishSample(self, now):
+        sample = self.__sample
+        if sample.latency is None:
+            sample.latency = now - self.__delivered
+
+        busy = self.__delay >= 0 and now - self.__delivered < self.__settleTimeout
+        if busy:
+            return False
+
+        sample.settled = now - self.__delivered
+        sample.cells = self.cells - sample.cells
+        sample.gitCalls = self.__gitCalls() - self.__gitBefore
+        self.__sample = None
+        return True
+
+    def getch(self):
+        now = time.perf_counter()
+        if self.__sample and not self.__finishSample(now):
+            # the UI is still loading in the background, give it the time a user would wait
+            time.sleep(self.__delay / 1000)
+            return curses.ERR
+
+        if self.__keys:
+            label, key = self.__keys.pop(0)
+        elif self.__quitKeys:
+            label, key = None, self.__quitKeys.pop(0)
+        else:
+            raise ReplayFinished()
+
+        if label is not None:
+            self.__sample = KeySample(label)
+            self.__sample.cells = self.cells
+            self.__gitBefore = self.__gitCalls()
+            self.samples.append(self.__sample)
+            self.__delivered = time.perf_counter()
+
+        return key
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = max(0, math.ceil(fraction * len(ordered)) - 1)
+    return ordered[index]
+
+
+def summarize(samples):
+    groups = OrderedDict()
+    groups['all keys'] = samples
+    for sample in samples:
+        groups.setdefault(sample.label, []).append(sample)
+
+    summary = OrderedDict()
+    for label, group in groups.items():
+        latencies = [ sample.latency * 1000 for sample in group if sample.latency is not None ]
+        if not latencies:
+            continue
+
+        summary[label] = {
+            'keys': len(group),
+            'p50': percentile(latencies, 0.5),
+            'p90': percentile(latencies, 0.9),
+            'p99': percentile(latencies, 0.99),
+            'max': max(latencies),
+            'frames': sum(sample.frames for sample in group),
+            'cells': sum(sample.cells for sample in group),
+            'git': sum(sum(sample.gitCalls.values()) for sample in group),
+        }
+
+    return summary
+
+
+def replayBranches(repository, keys, height=50, width=160):
+    from branches import UI
+
+    screen = FakeScreen(keys, height, width, repository.spawnedProcesses)
+    with headlessCurses():
+        # nothing changes the repository meanwhile, and watching would keep the UI from ever looking idle
+        ui = UI(repository, True, watch=False)
+        try:
+            ui.loop(screen)
+        except ReplayFinished:
+            pass
+
+    return screen
+
+
+def replayStage(stage, keys, height=50, width=160):
+    from stage import main
+
+    screen = FakeScreen(keys, height, width, stage.spawnedProcesses)
+    with headlessCurses():
+        try:
+            main(screen, stage, watch=False)
+        except ReplayFinished:
+            pass
+
+    return screen
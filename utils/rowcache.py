@@ -0,0 +1,31 @@
+from collections import OrderedDict
+
+
+class RowCache:
+
+    MAX_ROWS = 512
+
+    def __init__(self, maxRows=MAX_ROWS):
+        super().__init__()
+        self.__maxRows = maxRows
+        self.__rows = OrderedDict()
+        self.builds = 0
+
+    def get(self, data, key, build):
+        # the cached row keeps a reference to data, so id(data) cannot be reused while it is cached
+        key = (id(data),) + key
+        cached = self.__rows.get(key)
+        if cached is not None:
+            self.__rows.move_to_end(key)
+            return cached[1]
+
+        view = build()
+        self.builds += 1
+        self.__rows[key] = (data, view)
+        while len(self.__rows) > self.__maxRows:
+            self.__rows.popitem(last=False)
+
+        return view
+
+    def clear(self):
+        self.__rows.clear()
@@ -0,0 +1,136 @@
+import os
+import random
+import subprocess
+
+EPOCH = 1600000000
+AUTHOR = 'Benchmark <benchmark@example.com>'
+
+
+class SyntheticSpec:
+
+    def __init__(self, branches=100, depth=20, history=100, tracked=1000, modified=50, untracked=50, remotes=1, seed=0):
+        super().__init__()
+        self.branches = branches
+        self.depth = depth
+        self.history = history
+        self.tracked = tracked
+        self.modified = modified
+        self.untracked = untracked
+        self.remotes = remotes
+        self.seed = seed
+
+    def toDict(self):
+        return dict(vars(self))
+
+
+class FastImportStream:
+
+    def __init__(self):
+        super().__init__()
+        self.__chunks = []
+        self.__mark = 0
+        self.__time = EPOCH
+
+    def __data(self, content):
+        encoded = content.encode()
+        self.__chunks.append(b'data %d\n' % len(encoded))
+        self.__chunks.append(encoded + b'\n')
+
+    def blob(self, content):
+        self.__mark += 1
+        self.__chunks.append(b'blob\nmark :%d\n' % self.__mark)
+        self.__data(content)
+        return self.__mark
+
+    def commit(self, ref, message, parent=None, files=()):
+        self.__mark += 1
+        self.__time += 1
+        self.__chunks.append('commit {}\nmark :{}\ncommitter {} {} +0000\n'.format(ref, self.__mark, AUTHOR, self.__time).encode())
+        self.__data(message)
+        if parent is not None:
+            self.__chunks.append(b'from :%d\n' % parent)
+        for path, blob in files:
+            self.__chunks.append('M 100644 :{} {}\n'.format(blob, path).encode())
+        return self.__mark
+
+    def reset(self, ref, commit):
+        self.__chunks.append('reset {}\nfrom :{}\n\n'.format(ref, commit).encode())
+
+    def getvalue(self):
+        return b''.join(self.__chunks)
+
+
+def git(directory, *arguments, input=None):
+    subprocess.run(['git'] + list(arguments), cwd=directory, input=input, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def trackedPath(i):
+    return 'src/module{:03d}/file{:06d}.txt'.format(i % 100, i)
+
+
+def generate(directory, spec):
+    rng = random.Random(spec.seed)
+    repository = os.path.join(directory, 'repository')
+    remoteNames = [ 'origin' ] + [ 'remote{}'.format(i) for i in range(1, spec.remotes) ]
+
+    git(directory, 'init', '-q', repository)
+    git(repository, 'config', 'user.name', 'Benchmark')
+    git(repository, 'config', 'user.email', 'benchmark@example.com')
+
+    stream = FastImportStream()
+    files = [ (trackedPath(i), stream.blob('line {}\n'.format(i))) for i in range(spec.tracked) ]
+    tip = stream.commit('refs/heads/master', 'Initial commit', files=files)
+
+    historyBlob = stream.blob('history\n')
+    for i in range(spec.history):
+        tip = stream.commit('refs/heads/master', 'History {}'.format(i), tip, [ ('HISTORY', historyBlob) ])
+
+    upstreams = []
+    for i in range(spec.branches):
+        name = 'feature/TICKET-{}-synthetic'.format(i)
+        remote = remoteNames[i % len(remoteNames)]
+        ahead = rng.randint(0, spec.depth)
+        behind = rng.randint(0, spec.depth)
+
+        local = tip
+        for j in range(ahead):
+            local = stream.commit('refs/heads/' + name, '{} local {}'.format(name, j), local)
+        stream.reset('refs/heads/' + name, local)
+
+        upstream = tip
+        for j in range(behind):
+            upstream = stream.commit('refs/remotes/{}/{}'.format(remote, name), '{} upstream {}'.format(name, j), upstream)
+        stream.reset('refs/remotes/{}/{}'.format(remote, name), upstream)
+
+        upstreams.append((name, remote))
+
+    stream.reset('refs/heads/master', tip)
+    stream.reset('refs/remotes/origin/master', tip)
+    upstreams.append(('master', 'origin'))
+
+    git(repository, 'fast-import', '--quiet', input=stream.getvalue())
+
+    with open(os.path.join(repository, '.git', 'config'), 'a') as config:
+        for remote in remoteNames:
+            bare = os.path.join(directory, remote + '.git')
+            git(directory, 'init', '-q', '--bare', bare)
+            config.write('[remote "{0}"]\n\turl = {1}\n\tfetch = +refs/heads/*:refs/remotes/{0}/*\n'.format(remote, bare))
+        for name, remote in upstreams:
+            config.write('[branch "{}"]\n\tremote = {}\n\tmerge = refs/heads/{}\n'.format(name, remote, name))
+
+    for remote in remoteNames:
+        git(repository, 'push', '-q', remote, 'refs/remotes/{0}/*:refs/heads/*'.format(remote))
+
+    git(repository, 'checkout', '-q', '-f', 'master')
+
+    for i in rng.sample(range(spec.tracked), min(spec.modified, spec.tracked)):
+        with open(os.path.join(repository, trackedPath(i)), 'a') as file:
+            file.write('modified\n')
+
+    for i in range(spec.untracked):
+        path = os.path.join(repository, 'untracked', 'dir{:03d}'.format(i % 50), 'file{:06d}.txt'.format(i))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write('untracked {}\n'.format(i))
+
+    return repository
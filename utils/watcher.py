@@ -0,0 +1,351 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+from threading import Lock, Thread
+
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ISDIR = 0x40000000
+IN_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Changes:
+
+    def __init__(self):
+        super().__init__()
+        self.refs = False
+        self.index = False
+        self.paths = set()
+        # the events could not be told apart, e.g. because the kernel dropped some
+        self.everything = False
+
+    def add(self, kind, path=None):
+        if kind == 'refs':
+            self.refs = True
+        elif kind == 'index':
+            self.index = True
+        elif kind == 'path':
+            self.paths.add(path)
+        else:
+            self.everything = True
+
+    def isEmpty(self):
+        return not (self.refs or self.index or self.paths or self.everything)
+
+    def __repr__(self):
+        return '<Changes refs={}, index={}, paths={}, everything={} >'.format(self.refs, self.index, len(self.paths), self.everything)
+
+
+class RepositoryWatcher:
+
+    DEBOUNCE = 0.2
+    MAX_DELAY = 1.0
+    WAIT = 0.1
+
+    def __init__(self, repository, worktree=False):
+        super().__init__()
+        self.__repository = repository
+        self.__worktree = worktree
+        self.__pending = Changes()
+        self.__first = None
+        self.__last = None
+        self.__lock = Lock()
+        self.__stopped = False
+        self.backend = None
+
+        self.__thread = Thread(target=self.__watch, daemon=True)
+        self.__thread.start()
+
+    def __watch(self):
+        repo = self.__repository.repo
+        workTree = None
+        ignored = set()
+        if self.__worktree:
+            workTree = repo.working_tree_dir
+            # watching ignored directories, like node_modules, would only cost watches and wake ups
+            ignored = self.__repository.ignoredDirectories()
+
+        try:
+            backend = InotifyBackend(repo.git_dir, repo.common_dir, workTree, ignored)
+        except OSError:
+            backend = PollingBackend(repo.git_dir, repo.common_dir, workTree, ignored)
+        self.backend = backend
+
+        try:
+            while not self.__stopped:
+                events = backend.poll(RepositoryWatcher.WAIT)
+                if not events:
+                    continue
+
+                now = time.monotonic()
+                with self.__lock:
+                    for kind, path in events:
+                        self.__pending.add(kind, path)
+                    self.__first = self.__first or now
+                    self.__last = now
+        finally:
+            backend.close()
+
+    def collect(self):
+        # bursts, like a checkout touching thousands of files, are handed out once they calmed down
+        now = time.monotonic()
+        with self.__lock:
+            if self.__last is None:
+                return None
+
+            if now - self.__last < RepositoryWatcher.DEBOUNCE and now - self.__first < RepositoryWatcher.MAX_DELAY:
+                return None
+
+            changes, self.__pending = self.__pending, Changes()
+            self.__first = self.__last = None
+
+        return changes
+
+    def shutdown(self):
+        self.__stopped = True
+
+
+class InotifyBackend:
+
+    def __init__(self, gitDir, commonDir, workTree, ignored):
+        super().__init__()
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(self.__libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+
+        self.__fd = self.__libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.__fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+        self.__watches = {}
+        self.__ignored = ignored
+        try:
+            self.__addWatch(commonDir, ('git', None, commonDir))
+            self.__addWatch(gitDir, ('git', None, gitDir))
+            self.__addTree(os.path.join(commonDir, 'refs'), 'refs', None)
+            if workTree:
+                self.__addTree(workTree, 'worktree', '')
+        except OSError:
+            self.close()
+            raise
+
+    def __addWatch(self, path, watch):
+        descriptor = self.__libc.inotify_add_watch(self.__fd, os.fsencode(path), IN_MASK)
+        if descriptor < 0:
+            # running out of watches makes the caller fall back to polling
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+
+        self.__watches[descriptor] = watch
+
+    def __addTree(self, root, kind, relative):
+        for directory, directories, _ in os.walk(root):
+            path = os.path.relpath(directory, root).replace(os.sep, '/') if relative is not None else None
+            if path == '.':
+                path = ''
+
+            if kind == 'worktree':
+                if relative:
+                    path = relative + '/' + path if path else relative
+                directories[:] = [ name for name in directories if not self.__isExcluded(path + '/' + name if path else name) ]
+
+            self.__addWatch(directory, (kind, path, directory))
+
+    def __isExcluded(self, path):
+        return path == '.git' or path in self.__ignored
+
+    def poll(self, timeout):
+        readable, _, _ = select.select([ self.__fd ], [], [], timeout)
+        if not readable:
+            return []
+
+        try:
+            data = os.read(self.__fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            descriptor, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = os.fsdecode(data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0'))
+            offset += EVENT_HEADER.size + length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(('everything', None))
+                continue
+
+            if mask & IN_IGNORED:
+                self.__watches.pop(descriptor, None)
+                continue
+
+            if descriptor in self.__watches:
+                events.extend(self.__translate(self.__watches[descriptor], mask, name))
+
+        return events
+
+    def __translate(self, watch, mask, name):
+        kind, path, directory = watch
+        # git writes refs and the index to a lock file first and renames it once complete
+        if name.endswith('.lock'):
+            return []
+
+        if kind == 'git':
+            if name in ('HEAD', 'packed-refs'):
+                return [ ('refs', None) ]
+            if name == 'index':
+                return [ ('index', None) ]
+            return []
+
+        if kind == 'refs':
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.__tryAddTree(os.path.join(directory, name), 'refs', None)
+            return [ ('refs', None) ]
+
+        relative = path + '/' + name if path and name else path or name
+        if self.__isExcluded(relative):
+            return []
+
+        if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+            self.__tryAddTree(os.path.join(directory, name), 'worktree', relative)
+
+        return [ ('path', relative) ] if relative else [ ('everything', None) ]
+
+    def __tryAddTree(self, root, kind, relative):
+        try:
+            self.__addTree(root, kind, relative)
+        except OSError:
+            # the directory is reported either way, only changes below it could go unnoticed
+            pass
+
+    def close(self):
+        if self.__fd >= 0:
+            os.close(self.__fd)
+            self.__fd = -1
+
+
+class PollingBackend:
+
+    INTERVAL = 1.0
+    # walking the worktree costs far more than stating the few files git changes, so it is walked less often
+    # and, as long as nothing changes, less and less often
+    WORKTREE_INTERVAL = 2.0
+    MAX_WORKTREE_INTERVAL = 30.0
+
+    def __init__(self, gitDir, commonDir, workTree, ignored):
+        super().__init__()
+        self.__files = [ (os.path.join(gitDir, 'HEAD'), 'refs'), (os.path.join(gitDir, 'index'), 'index'), (os.path.join(commonDir, 'packed-refs'), 'refs') ]
+        self.__refs = os.path.join(commonDir, 'refs')
+        self.__workTree = workTree
+        self.__ignored = ignored
+        self.__gitSnapshot = self.__scanGit()
+        self.__workTreeSnapshot = self.__scanWorkTree()
+        self.__workTreeInterval = PollingBackend.WORKTREE_INTERVAL
+        now = time.monotonic()
+        self.__next = now + PollingBackend.INTERVAL
+        self.__nextWorkTree = now + self.__workTreeInterval
+
+    def __signature(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def __scanGit(self):
+        signatures = {}
+        for path, kind in self.__files:
+            signatures[(kind, path)] = self.__signature(path)
+
+        for directory, _, names in os.walk(self.__refs):
+            for name in names:
+                path = os.path.join(directory, name)
+                signatures[('refs', path)] = self.__signature(path)
+
+        return signatures
+
+    def __scanWorkTree(self):
+        signatures = {}
+        if not self.__workTree:
+            return signatures
+
+        # files are compared along with their directories, so files edited in place are noticed as well
+        pending = [ '' ]
+        while pending:
+            relative = pending.pop()
+            directory = os.path.join(self.__workTree, relative) if relative else self.__workTree
+            signatures[('path', relative)] = self.__signature(directory)
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                # removed while walking, which its parent directory tells
+                continue
+
+            for entry in entries:
+                path = relative + '/' + entry.name if relative else entry.name
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name != '.git' and path not in self.__ignored:
+                            pending.append(path)
+                    else:
+                        stat = entry.stat(follow_symlinks=False)
+                        signatures[('path', path)] = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+                except OSError:
+                    continue
+
+        return signatures
+
+    def __compare(self, previous, current):
+        events = set()
+        for key in set(previous) | set(current):
+            if previous.get(key) == current.get(key):
+                continue
+
+            kind, path = key
+            if kind != 'path':
+                events.add((kind, None))
+            else:
+                events.add(('path', path) if path else ('everything', None))
+
+        return events
+
+    def poll(self, timeout):
+        time.sleep(timeout)
+        now = time.monotonic()
+        if now < self.__next:
+            return []
+
+        previous, self.__gitSnapshot = self.__gitSnapshot, self.__scanGit()
+        events = self.__compare(previous, self.__gitSnapshot)
+        self.__next = now + PollingBackend.INTERVAL
+
+        # a checkout, reset or stash moves refs or the index along with the files, so the worktree is walked right away
+        if self.__workTree and (events or now >= self.__nextWorkTree):
+            previous, self.__workTreeSnapshot = self.__workTreeSnapshot, self.__scanWorkTree()
+            workTreeEvents = self.__compare(previous, self.__workTreeSnapshot)
+            if events or workTreeEvents:
+                self.__workTreeInterval = PollingBackend.WORKTREE_INTERVAL
+            else:
+                self.__workTreeInterval = min(self.__workTreeInterval * 2, PollingBackend.MAX_WORKTREE_INTERVAL)
+
+            events |= workTreeEvents
+            self.__nextWorkTree = now + self.__workTreeInterval
+
+        return list(events)
+
+    def close(self):
+        pass
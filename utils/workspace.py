@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock, Thread
+
+from utils.git import Repository, Stage
+
+
+def discoverRepositories(directory):
+    for root, directories, files in os.walk(directory):
+        if '.git' in directories or '.git' in files:
+            directories[:] = []
+            yield root
+        else:
+            directories[:] = sorted(d for d in directories if not d.startswith('.'))
+
+
+class WorkspaceBranch:
+
+    def __init__(self, repository, branch, active):
+        super().__init__()
+        self.repository = repository
+        self.head = branch.head
+        self.remote = None
+        self.upstream = str(branch.upstream) if branch.upstream else None
+        self.commitsAhead = branch.commitsAhead
+        self.commitsBehind = branch.commitsBehind
+        self.diff = branch.diff
+        self.pending = False
+        self.active = active
+
+    def __repr__(self):
+        return '<WorkspaceBranch repository={}, head={}, upstream={} >'.format(self.repository, self.head, self.upstream)
+
+
+def loadBranches(directory):
+    repository = Repository(directory)
+    active = None if repository.hasDetachedHead() else repository.active_branch_name()
+    return [ WorkspaceBranch(directory, branch, branch.head == active) for branch in repository.getBranches() ]
+
+
+class WorkspaceStatus:
+
+    def __init__(self, repository, branch, files):
+        super().__init__()
+        self.repository = repository
+        self.branch = branch
+        self.staged = sum(1 for file in files if file.is_staged())
+        self.untracked = sum(1 for file in files if not file.is_tracked())
+        self.unstaged = len(files) - self.staged - self.untracked
+
+    def hasChanges(self):
+        return self.staged + self.unstaged + self.untracked > 0
+
+    def __repr__(self):
+        return '<WorkspaceStatus repository={}, staged={}, unstaged={}, untracked={} >'.format(self.repository, self.staged, self.unstaged, self.untracked)
+
+
+def loadStatus(directory):
+    stage = Stage(directory)
+    branch = None if stage.hasDetachedHead() else stage.active_branch_name()
+    return WorkspaceStatus(directory, branch, stage.status())
+
+
+class WorkspaceLoader:
+
+    def __init__(self, directory, load, workers=None):
+        super().__init__()
+        self.__load = load
+        self.__executor = ProcessPoolExecutor(max_workers=workers)
+        self.__futures = {}
+        self.__lock = Lock()
+        self.__stopped = False
+        self.discovering = True
+        self.discovered = 0
+        self.loaded = 0
+        self.failed = []
+        # reloads replace what was loaded before and are not counted again
+        self.__loadedRepositories = set()
+
+        self.__thread = Thread(target=self.__discover, args=(directory,), daemon=True)
+        self.__thread.start()
+
+    def __discover(self, directory):
+        try:
+            for repository in discoverRepositories(directory):
+                if self.__stopped:
+                    break
+
+                self.reload(repository)
+                with self.__lock:
+                    self.discovered += 1
+        finally:
+            self.discovering = False
+
+    def reload(self, repository):
+        with self.__lock:
+            if not self.__stopped:
+                self.__futures[repository] = self.__executor.submit(self.__load, repository)
+
+    def collect(self):
+        with self.__lock:
+            done = [ (repository, future) for repository, future in self.__futures.items() if future.done() ]
+            for repository, _ in done:
+                del self.__futures[repository]
+
+        results = []
+        for repository, future in done:
+            self.__loadedRepositories.add(repository)
+            self.loaded = len(self.__loadedRepositories)
+            try:
+                results.append((repository, future.result()))
+                if repository in self.failed:
+                    self.failed.remove(repository)
+            except Exception:
+                # anything a worker process raises, including a broken pool, only affects this repository
+                if repository not in self.failed:
+                    self.failed.append(repository)
+
+        return results
+
+    def isLoading(self):
+        with self.__lock:
+            return self.discovering or len(self.__futures) > 0
+
+    def shutdown(self):
+        with self.__lock:
+            self.__stopped = True
+            for future in self.__futures.values():
+                future.cancel()
+
+        self.__executor.shutdown(wait=False)